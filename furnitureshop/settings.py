@@ -36,8 +36,9 @@ INSTALLED_APPS = [
 # ==========================
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'shop.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'shop.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -64,8 +65,9 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'shop.context_processors.cart',
 
-                # Optional: you can add this if you want categories or cart data globally later
+                # Optional: you can add this if you want categories data globally later
                 # 'shop.context_processors.categories',
             ],
         },
@@ -78,12 +80,184 @@ WSGI_APPLICATION = 'furnitureshop.wsgi.application'
 # ==========================
 # Database
 # =================A=========
+# WAL lets readers carry on while one writer commits. The journal mode is
+# stored in the database file itself, so migration 0020 sets it once rather
+# than every connection rewriting the file header.
+SQLITE_JOURNAL_MODE = 'WAL'
+
+# Run on every new SQLite connection. synchronous=NORMAL is still crash-safe
+# in WAL mode (a power cut can only lose the last commits, never corrupt the
+# file).
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    'cache_size': -config("SQLITE_CACHE_KB", default=20000, cast=int),  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Write transactions take the write lock at BEGIN. A deferred
+            # transaction that reads first and then writes fails at once
+            # with "database is locked" if another writer got in between;
+            # an immediate one just waits its turn.
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds to wait for the lock (SQLite's busy_timeout)
+            'timeout': config("SQLITE_BUSY_TIMEOUT", default=20, cast=int),
+        },
+        # Keep each worker thread's connection open across requests instead
+        # of reconnecting (and re-running the pragmas) every time; 0 closes
+        # it after each request, None never does
+        'CONN_MAX_AGE': config("DB_CONN_MAX_AGE", default=60, cast=int),
+        # Check a reused connection still works before the request uses it
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Postgres (needs psycopg[binary,pool]) when POSTGRES_DB is set. Connections
+# come from a psycopg pool shared by the threads of a worker process, which
+# works the same under WSGI and ASGI; Django itself must then not keep
+# connections (CONN_MAX_AGE=0). Pool stats are served at /metrics/db/.
+if config("POSTGRES_DB", default=""):
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config("POSTGRES_DB"),
+        'USER': config("POSTGRES_USER", default="postgres"),
+        'PASSWORD': config("POSTGRES_PASSWORD", default=""),
+        'HOST': config("POSTGRES_HOST", default="localhost"),
+        'PORT': config("POSTGRES_PORT", default="5432"),
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': config("DB_POOL_MIN_SIZE", default=2, cast=int),
+                'max_size': config("DB_POOL_MAX_SIZE", default=10, cast=int),
+                # Seconds a request waits for a free connection before failing
+                'timeout': config("DB_POOL_TIMEOUT", default=10, cast=float),
+                # Recycle connections so server-side memory does not creep up
+                'max_lifetime': config("DB_POOL_MAX_LIFETIME", default=1800, cast=float),
+                'max_idle': config("DB_POOL_MAX_IDLE", default=300, cast=float),
+                # Health check on checkout: a connection the server dropped
+                # is replaced instead of failing the request
+                'check': ConnectionPool.check_connection,
+            },
+        },
+    }
+
+# Read replicas: comma-separated SQLite files holding copies of the primary
+# (refresh them with `manage.py sync_replicas`), or add Postgres replicas to
+# DATABASES by hand and list their aliases here. Catalog reads are spread
+# over them by shop.routers.PrimaryReplicaRouter.
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(n.strip() for n in config("SQLITE_REPLICAS", default="").split(",")):
+    if _name:
+        DATABASES[f'replica{_index + 1}'] = {
+            **DATABASES['default'],
+            'NAME': _name,
+            # Tests read and write the one test database
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append(f'replica{_index + 1}')
+DATABASE_ROUTERS = ['shop.routers.PrimaryReplicaRouter']
+# Seconds a session keeps reading from the primary after it wrote
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=10, cast=int)
+
+# ==========================
+# Cache
+# ==========================
+# Set REDIS_URL (needs `pip install redis`) to share `default` between
+# worker processes, so an invalidation made by one (catalog version, order
+# tracking snapshots) is seen by all of them at once. Without it each
+# process has its own in-memory cache and those entries expire after a
+# short timeout instead (see CATALOG_VERSION_TIMEOUT). The cache is never
+# kept in the database: the reads it saves would just become queries.
+REDIS_URL = config("REDIS_URL", default='')
+if REDIS_URL:
+    _shared_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+else:
+    _shared_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'furnitureshop-default',
     }
+CACHES = {
+    'default': _shared_cache,
+    # Per process, even with Redis. Only for entries whose keys carry a
+    # version read from `default`, like the home page category sections: a
+    # bump changes the key, so a stale local copy is never read again.
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'furnitureshop',
+    },
 }
+# Seconds a rendered home page category section stays cached
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", default=900, cast=int)
+
+# Seconds a worker keeps a catalog version before starting a new one (0 =
+# until the next change). Only needed without Redis: a change saved in one
+# process then reaches the home pages of the others within this time.
+CATALOG_VERSION_TIMEOUT = config(
+    "CATALOG_VERSION_TIMEOUT", default=0 if REDIS_URL else 30, cast=int
+) or None
+
+# Seconds a worker answers search suggestions from its index before checking
+# the catalog version again; changes saved by the worker itself count at once
+SUGGEST_VERSION_CHECK_INTERVAL = config("SUGGEST_VERSION_CHECK_INTERVAL", default=5, cast=int)
+
+# Page size of the keyset-paginated product listings
+PRODUCTS_PER_PAGE = config("PRODUCTS_PER_PAGE", default=24, cast=int)
+
+# Page size of the keyset-paginated "My Orders" page
+ORDERS_PER_PAGE = config("ORDERS_PER_PAGE", default=10, cast=int)
+
+# Seconds an order's tracking timeline stays cached. A status change drops
+# it at once in the process that saved it, and with Redis in all of them;
+# without Redis other workers can serve the old timeline for this long.
+ORDER_TRACKING_CACHE_TIMEOUT = config(
+    "ORDER_TRACKING_CACHE_TIMEOUT", default=3600 if REDIS_URL else 30, cast=int
+)
+
+# Days from placing an order to its estimated delivery
+DELIVERY_ESTIMATE_DAYS = config("DELIVERY_ESTIMATE_DAYS", default=5, cast=int)
+
+# Order update streams (see shop/push.py). Leave the broker URL empty to
+# fan out within each process only; set it to tcp://host:port of
+# `manage.py order_events_broker` when running several processes.
+ORDER_EVENTS_BROKER_URL = config("ORDER_EVENTS_BROKER_URL", default='')
+# Seconds between keep-alive comments on an idle stream
+ORDER_EVENTS_KEEPALIVE = config("ORDER_EVENTS_KEEPALIVE", default=15, cast=int)
+# How long a browser waits before reconnecting a dropped stream (ms)
+ORDER_EVENTS_RETRY_MS = config("ORDER_EVENTS_RETRY_MS", default=3000, cast=int)
+
+# ==========================
+# Pricing (see shop/pricing.py)
+# ==========================
+# GST slabs as (discounted unit price from, rate). A line is taxed at the
+# rate of the highest slab it reaches, split equally into CGST and SGST.
+GST_SLABS = [
+    ('0', '0.18'),
+]
+# Flat charges added to every order as (name, amount, waived when the
+# subtotal reaches this amount, or None to always charge)
+ORDER_FEES = [
+    ('delivery_charge', '50.00', None),
+    ('packaging_charge', '20.00', None),
+    ('handling_charge', '15.00', None),
+]
+
+# ==========================
+# Product Search
+# ==========================
+# Dotted path to the search backend; shop.search.IcontainsSearchBackend is the portable fallback
+SEARCH_BACKEND = config("SEARCH_BACKEND", default="shop.search.SQLiteFTSSearchBackend")
+SEARCH_RESULTS_LIMIT = config("SEARCH_RESULTS_LIMIT", default=200, cast=int)
 
 # ==========================
 # Password Validators
@@ -115,6 +289,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Widths (px) of the responsive derivatives generated for product images
+PRODUCT_IMAGE_WIDTHS = [320, 640, 960]
+# Rendered invoices, cached per order and content hash (not under MEDIA_ROOT:
+# invoices are private and only served through download_invoice)
+INVOICE_CACHE_DIR = config("INVOICE_CACHE_DIR", default=str(BASE_DIR / 'var' / 'invoices'))
 
 # ==========================
 # Authentication Redirects
@@ -200,3 +379,16 @@ if not os.getenv('RAZORPAY_KEY_ID') or not os.getenv('RAZORPAY_KEY_SECRET'):
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID', default='')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')
 RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET', default='')
+
+# Gateway client (see shop/gateway.py). Point RAZORPAY_BASE_URL at
+# `manage.py fake_gateway` to run payments without the real API.
+RAZORPAY_BASE_URL = config('RAZORPAY_BASE_URL', default='https://api.razorpay.com')
+RAZORPAY_CONNECT_TIMEOUT = config('RAZORPAY_CONNECT_TIMEOUT', default=3.05, cast=float)
+RAZORPAY_READ_TIMEOUT = config('RAZORPAY_READ_TIMEOUT', default=10, cast=float)
+RAZORPAY_MAX_RETRIES = config('RAZORPAY_MAX_RETRIES', default=2, cast=int)
+RAZORPAY_RETRY_BACKOFF = config('RAZORPAY_RETRY_BACKOFF', default=0.25, cast=float)
+RAZORPAY_POOL_SIZE = config('RAZORPAY_POOL_SIZE', default=10, cast=int)
+# Consecutive failed calls before checkout stops calling the gateway, and
+# how many seconds it waits before trying again
+RAZORPAY_BREAKER_THRESHOLD = config('RAZORPAY_BREAKER_THRESHOLD', default=5, cast=int)
+RAZORPAY_BREAKER_RESET = config('RAZORPAY_BREAKER_RESET', default=30, cast=float)
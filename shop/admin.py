@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Category, Product, Profile, Order, OrderItem, WishlistItem, Cart, CartItem, Payment
+from django.db.models import Sum
+from .models import Category, Product, Profile, Order, OrderItem, OrderStatusEvent, WishlistItem, Cart, CartItem, Payment, WebhookEvent
 
 # =========================
 # CATEGORY ADMIN
@@ -40,8 +41,9 @@ class ProductAdmin(admin.ModelAdmin):
     )
 
     def discounted_price_display(self, obj):
-        return f"₹{obj.discounted_price()}"
+        return f"₹{obj.sale_price}"
     discounted_price_display.short_description = 'Discounted Price'
+    discounted_price_display.admin_order_field = 'sale_price'
 
     def image_tag(self, obj):
         if obj.image:
@@ -66,7 +68,7 @@ class ProfileAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
-    readonly_fields = ('product_link', 'quantity', 'total_price_display')
+    readonly_fields = ('product_link', 'quantity', 'unit_price', 'discount', 'total_price_display')
 
     def product_link(self, obj):
         url = reverse('admin:shop_product_change', args=[obj.product.id])
@@ -78,6 +80,18 @@ class OrderItemInline(admin.TabularInline):
     total_price_display.short_description = 'Item Total'
 
 
+class OrderStatusEventInline(admin.TabularInline):
+    model = OrderStatusEvent
+    extra = 0
+    can_delete = False
+    readonly_fields = ('status', 'created_at')
+    ordering = ('created_at',)
+
+    def has_add_permission(self, request, obj=None):
+        # Written by Order.save() when the status changes
+        return False
+
+
 # =========================
 # ORDER ADMIN
 # =========================
@@ -88,7 +102,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('customer__user__username',)
     ordering = ('-created_at',)
     list_per_page = 20
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderStatusEventInline]
     readonly_fields = ('total_price_display', 'created_at')
 
     fieldsets = (
@@ -100,8 +114,12 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # One SUM per page instead of loading every item of every order
+        return super().get_queryset(request).annotate(items_total=Sum('items__line_total'))
+
     def total_price_display(self, obj):
-        return f"₹{obj.total_price()}"
+        return f"₹{obj.items_total or 0}"
     total_price_display.short_description = "Total Price"
 
     def status_colored(self, obj):
@@ -134,7 +152,8 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'updated_at', 'total_items')
+    list_display = ('user', 'updated_at', 'item_count', 'subtotal')
+    readonly_fields = ('item_count', 'subtotal')
     search_fields = ('user__username',)
     ordering = ('-updated_at',)
     inlines = [CartItemInline]
@@ -144,3 +163,11 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id','order','amount','status','razorpay_order_id','razorpay_payment_id','created_at')
     search_fields = ('razorpay_order_id','razorpay_payment_id','order__id')
     ordering = ('-created_at',)
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id','event','received_at','processed_at','attempts')
+    list_filter = ('event','processed_at')
+    search_fields = ('event_id',)
+    ordering = ('-received_at',)
+    readonly_fields = ('event_id','event','payload','received_at')
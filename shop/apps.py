@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        # Register signal receivers that live outside models.py
+        from . import cart, catalog, dbmetrics, images, invoices, push, search, suggest, tracking  # noqa: F401
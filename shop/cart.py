@@ -0,0 +1,182 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connection, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+
+
+# --------------------------
+# Cart summary maintenance
+# --------------------------
+def adjust_summary(cart_id, quantity_delta, unit_price):
+    """Shift a cart's running totals by one line change, in a single UPDATE"""
+    if not quantity_delta:
+        return
+    Cart.objects.filter(pk=cart_id).update(
+        item_count=F('item_count') + quantity_delta,
+        subtotal=F('subtotal') + unit_price * quantity_delta,
+    )
+
+
+def refresh_summaries(carts):
+    """
+    Recompute item_count/subtotal for a Cart queryset from its items.
+
+    Used where a delta is not known (deletes, price changes) and to repair
+    drift; one UPDATE with correlated subqueries, no rows loaded in Python.
+    """
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    carts.update(
+        item_count=Coalesce(Subquery(lines.annotate(n=Sum('quantity')).values('n')), 0),
+        subtotal=Coalesce(
+            Subquery(lines.annotate(s=Sum(F('quantity') * F('product__sale_price'))).values('s')),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def cart_count(user):
+    """Header badge count: one indexed lookup of the denormalized counter"""
+    if not user.is_authenticated:
+        return 0
+    return Cart.objects.filter(user=user).values_list('item_count', flat=True).first() or 0
+
+
+# --------------------------
+# Cart mutations
+# --------------------------
+# Each mutation is one statement on the cart line (an INSERT .. ON CONFLICT
+# upsert, or an UPDATE/DELETE .. RETURNING) plus one statement on the cart's
+# running totals, so double clicks cannot lose updates and no rows are read
+# first. Requires INSERT .. RETURNING support (SQLite 3.35+, PostgreSQL).
+CartState = namedtuple('CartState', ['quantity', 'cart_count'])
+
+CART = Cart._meta.db_table
+ITEM = CartItem._meta.db_table
+PRODUCT = Product._meta.db_table
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def _shift_totals(user, product_id, delta):
+    """Apply a quantity delta for one product to the user's cart totals"""
+    row = _execute(
+        f"UPDATE {CART} SET item_count = item_count + %s, "
+        f"subtotal = subtotal + %s * (SELECT sale_price FROM {PRODUCT} WHERE id = %s), "
+        f"updated_at = %s WHERE user_id = %s RETURNING item_count",
+        [delta, delta, product_id, timezone.now(), user.pk],
+    )
+    return row[0] if row else 0
+
+
+def add_item(user, product_id, quantity=1):
+    """
+    Add `quantity` of a product to the user's cart, creating either row as needed.
+
+    Raises Product.DoesNotExist for an unknown product.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            cart_id, cart_count = _execute(
+                f"INSERT INTO {CART} (user_id, updated_at, item_count, subtotal) "
+                f"VALUES (%s, %s, %s, %s * (SELECT sale_price FROM {PRODUCT} WHERE id = %s)) "
+                f"ON CONFLICT (user_id) DO UPDATE SET "
+                f"item_count = {CART}.item_count + excluded.item_count, "
+                f"subtotal = {CART}.subtotal + excluded.subtotal, "
+                f"updated_at = excluded.updated_at "
+                f"RETURNING id, item_count",
+                [user.pk, now, quantity, quantity, product_id],
+            )
+            (item_quantity,) = _execute(
+                f"INSERT INTO {ITEM} (cart_id, product_id, quantity, added_at) "
+                f"VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (cart_id, product_id) DO UPDATE SET "
+                f"quantity = {ITEM}.quantity + excluded.quantity "
+                f"RETURNING quantity",
+                [cart_id, product_id, quantity, now],
+            )
+    except IntegrityError:
+        # NULL subtotal (no such product) or a failed product foreign key
+        raise Product.DoesNotExist(f"Product {product_id} does not exist")
+    return CartState(item_quantity, cart_count)
+
+
+def decrement_item(user, product_id):
+    """Take one unit off a cart line, removing the line when it reaches zero"""
+    with transaction.atomic():
+        row = _execute(
+            f"UPDATE {ITEM} SET quantity = quantity - 1 "
+            f"WHERE cart_id = (SELECT id FROM {CART} WHERE user_id = %s) "
+            f"AND product_id = %s AND quantity > 1 RETURNING quantity",
+            [user.pk, product_id],
+        )
+        if row:
+            return CartState(row[0], _shift_totals(user, product_id, -1))
+    return remove_item(user, product_id)
+
+
+def remove_item(user, product_id):
+    """Delete a cart line; quantity is 0 afterwards (None if it was not in the cart)"""
+    with transaction.atomic():
+        row = _execute(
+            f"DELETE FROM {ITEM} "
+            f"WHERE cart_id = (SELECT id FROM {CART} WHERE user_id = %s) "
+            f"AND product_id = %s RETURNING quantity",
+            [user.pk, product_id],
+        )
+        if not row:
+            return CartState(None, cart_count(user))
+        return CartState(0, _shift_totals(user, product_id, -row[0]))
+
+
+# Awaitable versions for the async views. Each mutation runs whole in
+# Django's database thread, so its transaction never spans an await.
+aadd_item = sync_to_async(add_item)
+adecrement_item = sync_to_async(decrement_item)
+aremove_item = sync_to_async(remove_item)
+
+
+# --------------------------
+# ORM-path signals
+# --------------------------
+# Admin edits and plain CartItem.save()/delete() go through these instead.
+@receiver(pre_save, sender=CartItem)
+def remember_quantity(sender, instance, raw=False, **kwargs):
+    instance._previous_quantity = 0
+    if not raw and instance.pk is not None:
+        instance._previous_quantity = (
+            CartItem.objects.filter(pk=instance.pk).values_list('quantity', flat=True).first() or 0
+        )
+
+
+@receiver(post_save, sender=CartItem)
+def cart_item_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    delta = instance.quantity - getattr(instance, '_previous_quantity', 0)
+    adjust_summary(instance.cart_id, delta, instance.product.discounted_price())
+
+
+@receiver(post_delete, sender=CartItem)
+def cart_item_deleted(sender, instance, **kwargs):
+    refresh_summaries(Cart.objects.filter(pk=instance.cart_id))
+
+
+@receiver(post_save, sender=Product)
+def product_repriced(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    refresh_summaries(Cart.objects.filter(items__product=instance))
@@ -0,0 +1,109 @@
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category, Product
+from .pagination import keyset_page
+
+# Bumped whenever a Product or Category changes. The home page template
+# fragments vary on this value, so a bump makes every cached section stale
+# without having to know which keys exist. It lives in the `default` cache:
+# with Redis a change saved by one worker process reaches all of them at
+# once, otherwise each process starts a new version every
+# CATALOG_VERSION_TIMEOUT seconds.
+CATALOG_VERSION_KEY = 'shop:catalog:version'
+
+
+# --------------------------
+# Catalog cache version
+# --------------------------
+def catalog_version():
+    """Return the current catalog version, creating it on first use"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # A new version never matches fragments cached under an expired one
+        version = time.time_ns()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=settings.CATALOG_VERSION_TIMEOUT):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def invalidate_catalog():
+    """Mark every cached catalog fragment as stale"""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=settings.CATALOG_VERSION_TIMEOUT)
+
+
+# --------------------------
+# Catalog queries
+# --------------------------
+def home_categories():
+    """
+    Categories with their products prefetched.
+
+    Always costs two queries no matter how many categories exist, instead of
+    one query per `category.products.all` in the template.
+    """
+    return Category.objects.order_by('id').prefetch_related(
+        Prefetch('products', queryset=Product.objects.order_by('-created_at'))
+    )
+
+
+# --------------------------
+# Keyset-paginated product listing
+# --------------------------
+def _decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def parse_listing_filters(params):
+    """Pick the supported listing filters out of a GET QueryDict"""
+    filters = {
+        'min_price': _decimal(params.get('min_price')),
+        'max_price': _decimal(params.get('max_price')),
+        'min_discount': _decimal(params.get('min_discount')),
+        'min_rating': _decimal(params.get('min_rating')),
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def product_listing(category=None, filters=None, cursor=None, page_size=24):
+    """
+    One page of products in the model's default (-created_at, -id) order.
+
+    See shop.pagination.keyset_page; returns (products, next_cursor).
+    """
+    filters = filters or {}
+    products = Product.objects.all()
+    if category is not None:
+        products = products.filter(category=category)
+    if 'min_price' in filters:
+        products = products.filter(sale_price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        products = products.filter(sale_price__lte=filters['max_price'])
+    if 'min_discount' in filters:
+        products = products.filter(discount__gte=filters['min_discount'])
+    if 'min_rating' in filters:
+        products = products.filter(rating__gte=filters['min_rating'])
+    return keyset_page(products, cursor, page_size)
+
+
+# --------------------------
+# Invalidation signals
+# --------------------------
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
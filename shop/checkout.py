@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+from django.db import connection, transaction
+
+from .models import Cart, CartItem, Order, OrderItem, Product
+from .pricing import price_basket
+
+
+class EmptyCheckout(Exception):
+    """Raised when there is nothing to turn into an order"""
+
+
+def create_order(user, lines, order=None, profile=None, **order_fields):
+    """
+    Turn (product_id, quantity) lines into an order in one transaction.
+
+    Product prices are read once, in a single query, and copied onto each
+    OrderItem (unit_price, discount, line_total); the order total is priced
+    from those same lines and all OrderItems go in with one bulk INSERT.
+    Pass `order` to fill an existing item-less order instead of creating one.
+    Returns the order.
+    """
+    quantities = OrderedDict()
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + max(int(quantity), 1)
+    if not quantities:
+        raise EmptyCheckout("No items to order")
+
+    with transaction.atomic():
+        products = Product.objects.only('id', 'name', 'image', 'image_variants', 'price', 'discount').in_bulk(list(quantities))
+        missing = set(quantities) - set(products)
+        if missing:
+            raise Product.DoesNotExist(f"Products {sorted(missing)} do not exist")
+
+        items = []
+        for pk, quantity in quantities.items():
+            item = OrderItem(product_id=pk, quantity=quantity)
+            item.snapshot_product(products[pk])
+            items.append(item)
+        order_fields['total_amount'] = price_basket(
+            (item.unit_price, item.discount, item.quantity) for item in items
+        )['grand_total']
+
+        if order is None:
+            order = Order.objects.create(
+                customer=profile or user.profile, user=user, **order_fields
+            )
+        else:
+            for field, value in order_fields.items():
+                setattr(order, field, value)
+            order.save(update_fields=list(order_fields))
+
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+    return order
+
+
+def clear_cart(user):
+    """Empty the user's cart in two statements, bypassing per-item signals"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {CartItem._meta.db_table} "
+            f"WHERE cart_id = (SELECT id FROM {Cart._meta.db_table} WHERE user_id = %s)",
+            [user.pk],
+        )
+    Cart.objects.filter(user=user).update(item_count=0, subtotal=0)
+
+
+def checkout_cart(user, order=None, **order_fields):
+    """Create (or fill) an order from the user's cart and empty the cart"""
+    lines = CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity')
+    with transaction.atomic():
+        order = create_order(user, list(lines), order=order, **order_fields)
+        clear_cart(user)
+    return order
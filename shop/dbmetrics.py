@@ -0,0 +1,62 @@
+import os
+import threading
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# New database connections opened by this process, by alias. With
+# persistent or pooled connections this should level off after warm-up;
+# if it keeps climbing with traffic, connections are not being reused.
+_opened = Counter()
+_lock = threading.Lock()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    with _lock:
+        _opened[connection.alias] += 1
+
+
+def pool_stats(connection):
+    """psycopg pool figures for a connection's alias, or None without a pool"""
+    pool = getattr(connection, 'pool', None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    requests = stats.get('requests_num', 0)
+    connects = stats.get('connections_num', 0)
+    return {
+        'size': stats.get('pool_size', 0),
+        'available': stats.get('pool_available', 0),
+        'min_size': stats.get('pool_min', pool.min_size),
+        'max_size': stats.get('pool_max', pool.max_size),
+        'requests_waiting': stats.get('requests_waiting', 0),
+        'checkouts': requests,
+        # Average time a checkout queued for a free connection
+        'checkout_wait_ms': round(stats.get('requests_wait_ms', 0) / requests, 3) if requests else 0,
+        'checkout_timeouts': stats.get('requests_errors', 0),
+        'connections_opened': connects,
+        # Average time to open a new server connection
+        'connect_ms': round(stats.get('connections_ms', 0) / connects, 3) if connects else 0,
+        'connections_lost': stats.get('connections_lost', 0),
+        'returned_bad': stats.get('returns_bad', 0),
+    }
+
+
+def snapshot():
+    """Connection metrics of this process for every configured database"""
+    with _lock:
+        opened = dict(_opened)
+    databases = {}
+    for alias in connections:
+        connection = connections[alias]
+        databases[alias] = {
+            'vendor': connection.vendor,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'connections_opened': opened.get(alias, 0),
+            'pool': pool_stats(connection),
+        }
+    return {'pid': os.getpid(), 'databases': databases}
@@ -0,0 +1,136 @@
+import json
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGateway(ThreadingHTTPServer):
+    """
+    In-process stand-in for the Razorpay orders API, for tests and local runs.
+
+    Point RAZORPAY_BASE_URL at `url` and the real client talks to it over
+    HTTP/1.1 keep-alive. `fail_next(n, status)` makes the next n requests
+    answer with a gateway error and `delay` slows every response down, so
+    retries, timeouts and the circuit breaker can be exercised. `requests`
+    counts the calls received and `connections` the TCP connections accepted.
+    """
+
+    daemon_threads = True
+    # Room for a burst of concurrent connects (socketserver's default is 5)
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeGatewayHandler)
+        self.orders = {}
+        self.requests = 0
+        self.connections = 0
+        self.delay = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count=1, status=503):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def next_failure(self):
+        with self._lock:
+            self.requests += 1
+            return self._failures.pop(0) if self._failures else None
+
+    def get_request(self):
+        request = super().get_request()
+        with self._lock:
+            self.connections += 1
+        return request
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is expected here
+        pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, code, description):
+        self._send(status, {'error': {'code': code, 'description': description}})
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        failure = self.server.next_failure()
+        if failure:
+            return self._error(failure, 'SERVER_ERROR', 'Injected failure')
+        if not self.headers.get('Authorization', '').startswith('Basic '):
+            return self._error(401, 'BAD_REQUEST_ERROR', 'Authentication failed')
+
+        path = self.path.split('?', 1)[0]
+        if method == 'POST' and path == '/v1/orders':
+            data = json.loads(body or b'{}')
+            if not isinstance(data.get('amount'), int) or data['amount'] < 100:
+                return self._error(400, 'BAD_REQUEST_ERROR', 'Order amount less than minimum amount allowed')
+            order = {
+                'id': f"order_{secrets.token_hex(7)}",
+                'entity': 'order',
+                'amount': data['amount'],
+                'amount_paid': 0,
+                'amount_due': data['amount'],
+                'currency': data.get('currency', 'INR'),
+                'receipt': data.get('receipt'),
+                'notes': data.get('notes', {}),
+                'status': 'created',
+                'attempts': 0,
+                'created_at': int(time.time()),
+            }
+            self.server.orders[order['id']] = order
+            return self._send(200, order)
+
+        match = re.fullmatch(r'/v1/orders/(\w+)', path)
+        if method == 'GET' and match:
+            order = self.server.orders.get(match.group(1))
+            if order is None:
+                return self._error(400, 'BAD_REQUEST_ERROR', 'The id provided does not exist')
+            return self._send(200, order)
+
+        self._error(404, 'BAD_REQUEST_ERROR', 'The requested URL was not found on the server.')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
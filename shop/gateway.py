@@ -0,0 +1,251 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+import razorpay
+from django.conf import settings
+
+
+class GatewayUnavailable(Exception):
+    """Raised without touching the network while the circuit breaker is open"""
+
+
+# --------------------------
+# Circuit breaker
+# --------------------------
+class CircuitBreaker:
+    """
+    Stop calling the gateway after `threshold` consecutive failures.
+
+    While open every call fails fast with GatewayUnavailable. After
+    `reset_timeout` seconds a single trial call is let through (half-open);
+    its outcome closes the breaker again or re-opens it for another period.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial_running):
+                raise GatewayUnavailable("Payment gateway is temporarily unavailable")
+            if state == 'half-open':
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+    def release(self):
+        """Give up a call without an outcome (e.g. cancelled); a half-open breaker allows a new trial"""
+        with self._lock:
+            self._trial_running = False
+
+
+# --------------------------
+# Async client (ASGI views)
+# --------------------------
+class AsyncGateway:
+    """
+    Pooled keep-alive httpx client for the Razorpay orders API, with
+    default timeouts, retries and a circuit breaker.
+
+    Connection errors, timeouts and 5xx responses are retried with jittered
+    exponential backoff (backoff, 2*backoff, 4*backoff ...). Only the final
+    outcome of a call counts towards the breaker. Retrying a POST may create
+    a second gateway order; an unpaid gateway order is harmless, and the
+    Payment row is only written for the one that is returned. Errors are
+    raised as the SDK's exception types.
+
+    Waiting on the gateway yields the event loop instead of holding a worker
+    thread. Bound to the event loop it was created on; views go through
+    arequest() instead of using it directly.
+    """
+
+    def __init__(self, key_id, key_secret, base_url, timeout=(3.05, 10), max_retries=2,
+                 backoff=0.25, pool_size=10, breaker=None):
+        connect_timeout, read_timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            auth=(key_id, key_secret),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def request(self, method, path, **kwargs):
+        self.breaker.before_call()
+        settled = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                try:
+                    response = await self.http.request(method, path, **kwargs)
+                except httpx.TransportError:
+                    if last_attempt:
+                        settled = True
+                        self.breaker.record_failure()
+                        raise
+                else:
+                    if response.status_code < 500:
+                        settled = True
+                        self.breaker.record_success()
+                        return self._result(response)
+                    if last_attempt:
+                        settled = True
+                        self.breaker.record_failure()
+                        return self._result(response)
+                delay = self.backoff * (2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.75, 1.25))
+        except asyncio.CancelledError:
+            # The caller went away (e.g. the client disconnected): no outcome
+            if not settled:
+                self.breaker.release()
+            raise
+        except BaseException:
+            # Anything unexpected counts against the gateway, and never
+            # leaves a half-open breaker waiting on a trial that has ended
+            if not settled:
+                self.breaker.record_failure()
+            raise
+
+    @staticmethod
+    def _result(response):
+        """JSON body of a 2xx response; otherwise the SDK's exception for the error code"""
+        if response.is_success:
+            return response.json()
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            error = {}
+        message = error.get('description', f"Gateway returned HTTP {response.status_code}")
+        code = str(error.get('code', '')).upper()
+        if code == 'BAD_REQUEST_ERROR':
+            raise razorpay.errors.BadRequestError(message)
+        if code == 'GATEWAY_ERROR':
+            raise razorpay.errors.GatewayError(message)
+        raise razorpay.errors.ServerError(message)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+# --------------------------
+# Process-wide clients
+# --------------------------
+_config_key = None
+_breaker = None
+_async_client = None
+_lock = threading.Lock()
+
+# The async client lives on its own event loop thread. Under WSGI every
+# async view gets a fresh loop, so a client bound to the view's loop could
+# never reuse a connection; this one is shared by all requests either way.
+_loop = None
+_loop_pid = None
+
+
+def _config():
+    return (
+        settings.RAZORPAY_KEY_ID,
+        settings.RAZORPAY_KEY_SECRET,
+        settings.RAZORPAY_BASE_URL,
+        settings.RAZORPAY_CONNECT_TIMEOUT,
+        settings.RAZORPAY_READ_TIMEOUT,
+        settings.RAZORPAY_MAX_RETRIES,
+        settings.RAZORPAY_RETRY_BACKOFF,
+        settings.RAZORPAY_POOL_SIZE,
+        settings.RAZORPAY_BREAKER_THRESHOLD,
+        settings.RAZORPAY_BREAKER_RESET,
+    )
+
+
+def _ensure_current():
+    """
+    Drop the client if the RAZORPAY_* settings changed (e.g. under
+    override_settings). Call with _lock held.
+    """
+    global _config_key, _breaker, _async_client
+    config = _config()
+    if _config_key != config:
+        if _async_client is not None:
+            asyncio.run_coroutine_threadsafe(_async_client.aclose(), _loop)
+        _async_client = None
+        # One breaker per process, shared by every request
+        _breaker = CircuitBreaker(config[8], config[9])
+        _config_key = config
+    return config
+
+
+def _gateway_loop():
+    """Start (or, after a fork, restart) the gateway event loop thread"""
+    global _loop, _loop_pid, _async_client
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            # A client inherited over fork is bound to the parent's loop,
+            # whose thread does not exist here
+            _async_client = None
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name='payment-gateway', daemon=True).start()
+        return _loop
+
+
+def _get_async_client():
+    """This process's AsyncGateway; only call on the gateway loop"""
+    global _async_client
+    with _lock:
+        key_id, key_secret, base_url, connect, read, retries, backoff, pool, _, _ = _ensure_current()
+        if _async_client is None:
+            _async_client = AsyncGateway(
+                key_id, key_secret, base_url, timeout=(connect, read), max_retries=retries,
+                backoff=backoff, pool_size=pool, breaker=_breaker,
+            )
+        return _async_client
+
+
+async def arequest(method, path, **kwargs):
+    """
+    Await a gateway call from any event loop.
+
+    The call runs on the gateway loop; the caller's loop is free to serve
+    other requests until the result arrives.
+    """
+    async def call():
+        return await _get_async_client().request(method, path, **kwargs)
+
+    future = asyncio.run_coroutine_threadsafe(call(), _gateway_loop())
+    return await asyncio.wrap_future(future)
+
+
+async def acreate_order(data):
+    return await arequest('POST', '/v1/orders', json=data)
@@ -0,0 +1,154 @@
+import hashlib
+import io
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete
+from django.dispatch import receiver
+from PIL import Image, features
+
+from .catalog import invalidate_catalog
+from .models import OrderItem, Product
+
+# Preferred order for <picture> sources: smallest files first
+FORMATS = (
+    ('avif', 'AVIF', 'image/avif', {'quality': 50}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 75, 'method': 4}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+
+
+def available_formats():
+    """FORMATS entries this Pillow build can actually encode"""
+    return [f for f in FORMATS if f[1] == 'JPEG' or features.check(f[1].lower())]
+
+
+def variant_name(name, digest, width, ext):
+    """products/sofa.png -> products/sofa.<digest>.<width>w.<ext>, next to the original"""
+    folder, filename = posixpath.split(name)
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(folder, f"{stem}.{digest}.{width}w.{ext}")
+
+
+def _flatten(image):
+    """RGB copy of `image`, compositing any transparency onto white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(name, widths=None, storage=None):
+    """
+    Write resized AVIF/WebP/JPEG copies of the stored image `name`.
+
+    Variant filenames embed a hash of the original's bytes, so a replaced
+    image never collides with stale derivatives and existing ones are reused.
+    Touches only storage, never the database, so it can run in a worker
+    process. Returns the manifest stored on Product.image_variants.
+    """
+    storage = storage or default_storage
+    widths = widths or settings.PRODUCT_IMAGE_WIDTHS
+
+    with storage.open(name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+
+    with Image.open(io.BytesIO(data)) as original:
+        original = _flatten(original)
+        # Never upscale; the original width caps the set
+        targets = sorted({w for w in widths if w < original.width} | {min(max(widths), original.width)})
+        formats = {}
+        for ext, pil_format, _, options in available_formats():
+            formats[ext] = {}
+            for width in targets:
+                target = variant_name(name, digest, width, ext)
+                if not storage.exists(target):
+                    height = round(original.height * width / original.width)
+                    resized = original.resize((width, height), Image.Resampling.LANCZOS)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, pil_format, **options)
+                    storage.save(target, ContentFile(buffer.getvalue()))
+                formats[ext][str(width)] = target
+
+    return {'source': name, 'hash': digest, 'formats': formats}
+
+
+def refresh_product_images(product, force=False):
+    """Regenerate derivatives when the product's image differs from its manifest"""
+    if not product.image:
+        return
+    if not force and product.image_variants.get('source') == product.image.name:
+        return
+    product.image_variants = generate_variants(product.image.name)
+    Product.objects.filter(pk=product.pk).update(image_variants=product.image_variants)
+
+    # The cached home sections embed image URLs
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Product)
+def product_image_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        refresh_product_images(instance)
+    except (OSError, ValueError):
+        # Missing or unreadable originals fall back to the plain image URL
+        pass
+
+
+# ========================
+# Blob reference counting
+# ========================
+def _release_now(name):
+    storage = Product._meta.get_field('image').storage
+    references = Product.objects.filter(image=name).count() + OrderItem.objects.filter(image=name).count()
+    storage.release(name, references=references)
+
+
+def release_image(name):
+    """
+    Delete a stored image once no product or order line references it any more.
+
+    Done after the surrounding transaction commits, with the references
+    counted again at that point: a rollback leaves the file its rows still
+    point at, and a product that picked up the same blob in the meantime
+    keeps it alive.
+    """
+    if not name:
+        return
+    transaction.on_commit(lambda: _release_now(name), robust=True)
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_image(sender, instance, raw=False, **kwargs):
+    instance._previous_image = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_image = (
+        Product.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def release_replaced_image(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if previous and previous != instance.image.name:
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Product)
+def release_deleted_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+@receiver(post_delete, sender=OrderItem)
+def release_order_item_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Order, OrderItem
+
+# Bump when the layout changes so every cached invoice is rendered again
+LAYOUT_VERSION = 1
+
+FORMATS = {
+    'pdf': 'application/pdf',
+    'txt': 'text/plain; charset=utf-8',
+}
+
+RULE = '-' * 40
+DOUBLE_RULE = '=' * 40
+
+
+# --------------------------
+# Invoice data
+# --------------------------
+def invoice_orders():
+    """Orders with everything an invoice prints, in two queries however many orders"""
+    return Order.objects.select_related('customer__user').prefetch_related('items')
+
+
+def invoice_data(order):
+    """
+    Plain (picklable) dict of what goes on `order`'s invoice.
+
+    Fetch the order through invoice_orders() so the lines do not load their
+    products one query at a time.
+    """
+    user = order.customer.user
+    return {
+        'order_id': order.id,
+        'date': order.created_at.strftime('%d %B, %Y'),
+        'status': order.status,
+        'name': user.get_full_name() or user.username,
+        'email': user.email,
+        'phone': order.customer.mobile_number or 'N/A',
+        'address': order.shipping_address or 'N/A',
+        'items': [
+            (item.product_name, item.quantity, f"{item.discounted_unit_price():.2f}", str(item.line_total))
+            for item in order.items.all()
+        ],
+        'total_amount': str(order.total_amount),
+        'payment_method': order.payment_method.upper(),
+        'payment_status': order.payment_status,
+    }
+
+
+def digest(data):
+    """Content hash of an invoice: any change to what it prints changes the hash"""
+    payload = json.dumps([LAYOUT_VERSION, data], sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+# --------------------------
+# Renderers
+# --------------------------
+def invoice_lines(data):
+    """The invoice as lines of text, shared by both formats"""
+    yield DOUBLE_RULE
+    yield 'IDEAL FURNITURE - INVOICE'
+    yield DOUBLE_RULE
+    yield ''
+    yield f"Order ID: #{data['order_id']}"
+    yield f"Date: {data['date']}"
+    yield f"Status: {data['status']}"
+    yield ''
+    yield RULE
+    yield 'CUSTOMER DETAILS'
+    yield RULE
+    yield f"Name: {data['name']}"
+    yield f"Email: {data['email']}"
+    yield f"Phone: {data['phone']}"
+    yield ''
+    yield RULE
+    yield 'SHIPPING ADDRESS'
+    yield RULE
+    yield from data['address'].splitlines() or ['']
+    yield ''
+    yield RULE
+    yield 'ORDER ITEMS'
+    yield RULE
+    for name, quantity, price, subtotal in data['items']:
+        yield name
+        yield f"Quantity: {quantity}"
+        yield f"Price: ₹{price}"
+        yield f"Subtotal: ₹{subtotal}"
+        yield RULE
+    yield ''
+    yield RULE
+    yield 'PAYMENT SUMMARY'
+    yield RULE
+    yield f"Total Amount: ₹{data['total_amount']}"
+    yield f"Payment Method: {data['payment_method']}"
+    yield f"Payment Status: {data['payment_status']}"
+    yield ''
+    yield DOUBLE_RULE
+    yield 'Thank you for shopping with us!'
+    yield DOUBLE_RULE
+
+
+def render_text(data):
+    """UTF-8 text invoice, one chunk per line"""
+    for line in invoice_lines(data):
+        yield f"{line}\n".encode()
+
+
+# A4 in points, Courier 10pt so the rules line up as in the text version
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 56
+FONT_SIZE = 10
+LEADING = 13
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+
+def _pdf_text(line):
+    # The standard fonts have no rupee sign; WinAnsi covers the rest of Latin-1
+    line = line.replace('₹', 'Rs. ')
+    line = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return line.encode('cp1252', errors='replace')
+
+
+def render_pdf(data):
+    """
+    Single-font PDF invoice, streamed object by object.
+
+    The page tree and cross-reference table are written last, so nothing but
+    the current page is held in memory.
+    """
+    offset = 0
+    offsets = {}
+
+    def obj(number, body):
+        nonlocal offset
+        offsets[number] = offset
+        chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        offset += len(chunk)
+        return chunk
+
+    def page_chunks(number, lines):
+        content = b'BT /F1 %d Tf %d TL %d %d Td\n' % (FONT_SIZE, LEADING, MARGIN, PAGE_HEIGHT - MARGIN)
+        content += b''.join(b'(' + _pdf_text(line) + b") '\n" for line in lines)
+        content += b'ET'
+        yield obj(number, b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        yield obj(number + 1, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+        ) % (PAGE_WIDTH, PAGE_HEIGHT, number))
+
+    # 1: catalog, 2: page tree, 3: font, then a content stream and page per page
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    offset += len(header)
+    yield header
+    yield obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+
+    pages = []
+    lines = []
+    for line in invoice_lines(data):
+        lines.append(line)
+        if len(lines) == LINES_PER_PAGE:
+            number = 4 + 2 * len(pages)
+            yield from page_chunks(number, lines)
+            pages.append(number + 1)
+            lines = []
+    if lines or not pages:
+        number = 4 + 2 * len(pages)
+        yield from page_chunks(number, lines)
+        pages.append(number + 1)
+
+    kids = b' '.join(b'%d 0 R' % page for page in pages)
+    yield obj(2, b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(pages))
+    yield obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    size = max(offsets) + 1
+    xref = b'xref\n0 %d\n0000000000 65535 f \n' % size
+    xref += b''.join(b'%010d 00000 n \n' % offsets[number] for number in range(1, size))
+    yield xref + b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, offset)
+
+
+RENDERERS = {
+    'pdf': render_pdf,
+    'txt': render_text,
+}
+
+
+# --------------------------
+# Disk cache
+# --------------------------
+def cache_dir(order_id):
+    """One directory per order, so dropping an order's invoices never scans the others"""
+    return Path(settings.INVOICE_CACHE_DIR) / str(order_id)
+
+
+def cache_path(order_id, data_digest, fmt):
+    return cache_dir(order_id) / f"{data_digest}.{fmt}"
+
+
+def discard(order_id):
+    """Delete every cached rendering of an order"""
+    folder = cache_dir(order_id)
+    if folder.is_dir():
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def _discard_stale(path, fmt):
+    for other in path.parent.glob(f"*.{fmt}"):
+        if other != path:
+            other.unlink(missing_ok=True)
+
+
+def cached_stream(data, fmt):
+    """
+    Rendered invoice chunks, written through to the disk cache.
+
+    The file only takes its final name once the last chunk has been
+    rendered, so an abandoned download never leaves a truncated invoice
+    behind. Concurrent renders of the same invoice write identical bytes.
+    """
+    path = cache_path(data['order_id'], digest(data), fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.render-')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in RENDERERS[fmt](data):
+                fh.write(chunk)
+                yield chunk
+        try:
+            os.replace(tmp, path)
+        except FileNotFoundError:
+            # The order changed (and its folder was dropped) mid-render
+            return
+        _discard_stale(path, fmt)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def cached_file(data, fmt):
+    """Path of an up-to-date cached rendering, or None"""
+    path = cache_path(data['order_id'], digest(data), fmt)
+    return path if path.exists() else None
+
+
+def render_to_cache(data, formats=tuple(FORMATS)):
+    """
+    Make sure every format of one invoice is cached; returns how many were rendered.
+
+    Touches only the cache directory, never the database, so it can run in
+    a worker process.
+    """
+    rendered = 0
+    for fmt in formats:
+        if cached_file(data, fmt) is None:
+            for _ in cached_stream(data, fmt):
+                pass
+            rendered += 1
+    return rendered
+
+
+# --------------------------
+# Cache invalidation
+# --------------------------
+# The digest already keys every rendering by content, so an edited order
+# can never be served a stale invoice (even after a queryset update() that
+# skips these signals). Dropping the files on save just reclaims the space.
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    discard(instance.pk)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    discard(instance.order_id)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import razorpay
+import requests
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from requests.adapters import HTTPAdapter
+
+from shop import gateway
+from shop.fake_gateway import FakeGateway
+
+KEY_ID, KEY_SECRET = 'rzp_bench', 'bench_secret'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time gateway order creation against a fake gateway with the same number of calls "
+        "in flight: the old sync razorpay.Client path, one call per WSGI thread (as a "
+        "gunicorn gthread worker with --threads N runs it), vs the async gateway client "
+        "the payment views await now."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=50, help="Gateway orders per run")
+        parser.add_argument('--concurrency', type=int, default=10,
+                            help="Calls in flight at once (WSGI threads / concurrent requests)")
+        parser.add_argument('--latency', type=float, default=0.2,
+                            help="Simulated gateway round trip in seconds")
+
+    def handle(self, *args, **options):
+        checkouts, concurrency = options['checkouts'], options['concurrency']
+        with FakeGateway() as fake:
+            fake.delay = options['latency']
+            with override_settings(
+                RAZORPAY_KEY_ID=KEY_ID, RAZORPAY_KEY_SECRET=KEY_SECRET,
+                RAZORPAY_BASE_URL=fake.url, RAZORPAY_POOL_SIZE=concurrency,
+                RAZORPAY_MAX_RETRIES=0,
+            ):
+                sync_elapsed, sync_threads = self.sync_run(fake.url, checkouts, concurrency)
+                async_elapsed, async_threads = self.async_run(checkouts, concurrency)
+
+        self.stdout.write(
+            f"{checkouts} checkouts, {concurrency} in flight, "
+            f"{options['latency'] * 1000:.0f} ms gateway latency"
+        )
+        for label, elapsed, threads in (
+            ('sync razorpay.Client', sync_elapsed, sync_threads),
+            ('async gateway', async_elapsed, async_threads),
+        ):
+            self.stdout.write(
+                f"  {label:20} {elapsed:6.2f} s  {checkouts / elapsed:7.1f} checkouts/s  "
+                f"{threads:3} thread(s) waiting on the gateway"
+            )
+
+    @staticmethod
+    def order_data():
+        return dict(amount=499900, currency='INR', payment_capture=1)
+
+    def sync_run(self, base_url, checkouts, concurrency):
+        # The pre-async path: one keep-alive session shared by the worker's threads
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        client = razorpay.Client(session=session, auth=(KEY_ID, KEY_SECRET), base_url=base_url)
+        client.order.create(self.order_data())  # warm up
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(lambda _: client.order.create(self.order_data()), range(checkouts)))
+            elapsed = time.perf_counter() - start
+        session.close()
+        assert all(result['status'] == 'created' for result in results)
+        return elapsed, concurrency
+
+    def async_run(self, checkouts, concurrency):
+        async def run():
+            await gateway.acreate_order(self.order_data())  # warm up
+            # As many concurrent requests as the sync run had threads
+            slots = asyncio.Semaphore(concurrency)
+
+            async def checkout():
+                async with slots:
+                    return await gateway.acreate_order(self.order_data())
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(checkout() for _ in range(checkouts)))
+            elapsed = time.perf_counter() - start
+            assert all(result['status'] == 'created' for result in results)
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        # Every call waited on the single gateway loop thread
+        loop_threads = sum(thread.name == 'payment-gateway' for thread in threading.enumerate())
+        return elapsed, loop_threads
@@ -0,0 +1,75 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from shop.models import CartItem, Product
+from shop.pricing import engine
+
+LEGACY_FEES = Decimal('50.00') + Decimal('20.00') + Decimal('15.00')
+
+
+def legacy_total(items):
+    """The old per-item path: discounted_price() per line, then bill() on the sum"""
+    subtotal = Decimal('0')
+    for item in items:
+        product = item.product
+        if product.discount > 0:
+            price = product.price - product.price * product.discount / 100
+        else:
+            price = product.price
+        subtotal += price * item.quantity
+    cgst = round(subtotal * Decimal('0.09'), 2)
+    sgst = round(subtotal * Decimal('0.09'), 2)
+    return subtotal + cgst + sgst + LEGACY_FEES
+
+
+class Command(BaseCommand):
+    help = "Compare pricing many carts via per-item model methods vs PricingEngine.price_many (in memory)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--lines', type=int, default=6, help="Lines per cart")
+        parser.add_argument('--products', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        products = [
+            Product(id=pk, price=Decimal(rng.randint(500, 500000)) / 100,
+                    discount=rng.choice([0, 5, 10, 15, 20, 25, 50]))
+            for pk in range(1, options['products'] + 1)
+        ]
+        carts = [
+            [CartItem(product=product, quantity=rng.randint(1, 5))
+             for product in rng.sample(products, options['lines'])]
+            for _ in range(options['carts'])
+        ]
+        # What reprice_carts() gets back from its single values_list() query
+        rows = [
+            (cart_id, item.product.price, item.product.discount, item.quantity)
+            for cart_id, items in enumerate(carts) for item in items
+        ]
+
+        def best_of(run, repeat=5):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        pricing = engine()
+        assert len(pricing.price_many(rows)) == len(carts)
+        legacy = best_of(lambda: [legacy_total(items) for items in carts])
+        methods = best_of(lambda: [sum(item.line_total() for item in items) for items in carts])
+        batch = best_of(lambda: pricing.price_many(rows))
+
+        lines = len(rows)
+        self.stdout.write(f"{len(carts)} carts, {lines} lines")
+        for label, elapsed in (
+            ('legacy discounted_price() + bill()', legacy),
+            ('CartItem.line_total() per item', methods),
+            ('PricingEngine.price_many (full bills)', batch),
+        ):
+            self.stdout.write(f"  {label:40} {elapsed * 1000:8.1f} ms  {elapsed / lines * 1e6:6.2f} us/line")
@@ -0,0 +1,53 @@
+import timeit
+
+import razorpay
+from django.core.management.base import BaseCommand
+
+from shop import signatures
+
+SECRET = 'bench_secret_0123456789'
+ORDER_ID = 'order_Bench1234567890'
+PAYMENT_ID = 'pay_Bench1234567890'
+
+
+class Command(BaseCommand):
+    help = "Compare payment/webhook signature checks: SDK client per request vs shop.signatures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help="Checks per timing run")
+        parser.add_argument('--body-size', type=int, default=2048, help="Webhook body size in bytes")
+
+    def handle(self, *args, **options):
+        number = options['number']
+        body = (b'{"event":"payment.captured","payload":' + b'x' * options['body_size'])[:options['body_size']]
+        payment_sig = signatures.sign(f"{ORDER_ID}|{PAYMENT_ID}", SECRET)
+        webhook_sig = signatures.sign(body, SECRET)
+        params = {
+            'razorpay_order_id': ORDER_ID,
+            'razorpay_payment_id': PAYMENT_ID,
+            'razorpay_signature': payment_sig,
+        }
+
+        def sdk_payment():
+            razorpay.Client(auth=('rzp_bench', SECRET)).utility.verify_payment_signature(params)
+
+        def sdk_webhook():
+            client = razorpay.Client(auth=('rzp_bench', SECRET))
+            client.utility.verify_webhook_signature(body.decode(), webhook_sig, SECRET)
+
+        def local_payment():
+            assert signatures.verify_payment_signature(ORDER_ID, PAYMENT_ID, payment_sig, SECRET)
+
+        def local_webhook():
+            assert signatures.verify_webhook_signature(body, webhook_sig, SECRET)
+
+        for label, baseline, fast in (
+            ('payment', sdk_payment, local_payment),
+            ('webhook', sdk_webhook, local_webhook),
+        ):
+            before = min(timeit.repeat(baseline, number=number, repeat=3)) / number * 1e6
+            after = min(timeit.repeat(fast, number=number, repeat=3)) / number * 1e6
+            self.stdout.write(
+                f"{label:8} SDK client per call: {before:8.2f} us   "
+                f"shop.signatures: {after:6.2f} us   ({before / after:.0f}x)"
+            )
@@ -0,0 +1,164 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+ALIAS = 'sqlite_bench'
+
+READ_SQL = (
+    "SELECT id, name, sale_price FROM shop_product "
+    "WHERE category_id = %s ORDER BY created_at DESC, id DESC LIMIT 24"
+)
+
+
+def _checkout(cursor, user_id, profile_id, product_ids, rng):
+    """What create_order() and payment_create write: order, lines, payment"""
+    cursor.execute(
+        "SELECT id, price, discount FROM shop_product WHERE id IN (%s, %s, %s)",
+        rng.sample(product_ids, 3),
+    )
+    lines = cursor.fetchall()
+    cursor.execute(
+        "INSERT INTO shop_order (customer_id, user_id, status, payment_status, total_amount, "
+        "payment_method, shipping_address, created_at) "
+        "VALUES (%s, %s, 'Pending', 'Pending', 0, 'online', 'Bench Street', datetime('now'))",
+        [profile_id, user_id],
+    )
+    order_id = cursor.lastrowid
+    for product_id, price, discount in lines:
+        cursor.execute(
+            "INSERT INTO shop_orderitem (order_id, product_id, quantity, unit_price, discount, line_total) "
+            "VALUES (%s, %s, 1, %s, %s, %s)",
+            [order_id, product_id, price, discount, price],
+        )
+    cursor.execute(
+        "UPDATE shop_order SET total_amount = (SELECT SUM(line_total) FROM shop_orderitem "
+        "WHERE order_id = %s) WHERE id = %s",
+        [order_id, order_id],
+    )
+    cursor.execute(
+        "INSERT INTO shop_payment (order_id, razorpay_order_id, amount, status, created_at) "
+        "VALUES (%s, %s, 0, 'created', datetime('now'))",
+        [order_id, f'order_bench_{order_id}'],
+    )
+
+
+def _worker(args):
+    """One 'gunicorn worker': a loop of page reads and checkouts for `duration` seconds"""
+    worker, duration, write_share, ids = args
+    user_id, profile_id, category_ids, product_ids = ids
+    rng = random.Random(worker)
+    connection = connections[ALIAS]
+    reads = writes = locked = 0
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_share:
+                with transaction.atomic(using=ALIAS):
+                    _checkout(connection.cursor(), user_id, profile_id, product_ids, rng)
+                writes += 1
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(READ_SQL, [rng.choice(category_ids)])
+                    cursor.fetchall()
+                reads += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return reads, writes, locked, latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent page reads and checkout writes from several processes on a "
+        "scratch SQLite file: stock SQLite settings vs the tuned DATABASES OPTIONS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent processes")
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per run")
+        parser.add_argument('--write-share', type=float, default=0.2,
+                            help="Fraction of operations that are checkouts")
+        parser.add_argument('--products', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        default = settings.DATABASES['default']
+        if default['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The default database is not SQLite")
+
+        configs = (
+            ('stock SQLite', {}, 'DELETE'),
+            ('tuned (settings)', default.get('OPTIONS', {}), settings.SQLITE_JOURNAL_MODE),
+        )
+        for label, db_options, journal_mode in configs:
+            with tempfile.TemporaryDirectory() as folder:
+                self.run(label, os.path.join(folder, 'bench.sqlite3'), db_options, journal_mode, options)
+
+    def run(self, label, path, db_options, journal_mode, options):
+        connections.settings[ALIAS] = dict(connections.settings['default'], NAME=path, OPTIONS=db_options)
+        try:
+            ids = self.seed(options['products'], journal_mode)
+            # Forked workers must not inherit open database connections
+            connections.close_all()
+            jobs = [(worker, options['duration'], options['write_share'], ids)
+                    for worker in range(options['workers'])]
+            with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+                results = pool.map(_worker, jobs)
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+
+        reads = sum(r[0] for r in results)
+        writes = sum(r[1] for r in results)
+        locked = sum(r[2] for r in results)
+        latencies = sorted(latency for r in results for latency in r[3])
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+        duration = options['duration']
+        self.stdout.write(
+            f"{label:17} reads {reads / duration:8.0f}/s  checkouts {writes / duration:7.0f}/s  "
+            f"'database is locked' {locked:5}  p99 {p99 * 1000:7.1f} ms"
+        )
+
+    def seed(self, products, journal_mode):
+        call_command('migrate', database=ALIAS, verbosity=0)
+        # migrate switches the file to WAL; put the stock run back on
+        # SQLite's default rollback journal
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        with transaction.atomic(using=ALIAS), connections[ALIAS].cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO auth_user (username, password, is_superuser, is_staff, is_active, "
+                "first_name, last_name, email, date_joined) "
+                "VALUES ('bench', '!', 0, 0, 1, '', '', '', datetime('now'))"
+            )
+            user_id = cursor.lastrowid
+            cursor.execute("INSERT INTO shop_profile (user_id) VALUES (%s)", [user_id])
+            profile_id = cursor.lastrowid
+            category_ids = []
+            for n in range(10):
+                cursor.execute(
+                    "INSERT INTO shop_category (name, slug) VALUES (%s, %s)", [f'Bench {n}', f'bench-{n}']
+                )
+                category_ids.append(cursor.lastrowid)
+            product_ids = []
+            for n in range(products):
+                cursor.execute(
+                    "INSERT INTO shop_product (category_id, name, slug, price, discount, sale_price, "
+                    "description, rating, created_at, image, image_variants) "
+                    "VALUES (%s, %s, %s, 1000, 10, 900, '', 4.5, datetime('now'), '', '{}')",
+                    [category_ids[n % len(category_ids)], f'Bench item {n}', f'bench-item-{n}'],
+                )
+                product_ids.append(cursor.lastrowid)
+        return user_id, profile_id, category_ids, product_ids
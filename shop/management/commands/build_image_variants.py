@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop.catalog import invalidate_catalog
+from shop.images import generate_variants
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Generate responsive AVIF/WebP/JPEG derivatives for every product image"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: one per CPU)")
+        parser.add_argument('--force', action='store_true',
+                            help="Rebuild manifests even for products that already have one")
+
+    def handle(self, *args, **options):
+        products = [
+            p for p in Product.objects.exclude(image='').only('id', 'image', 'image_variants')
+            if options['force'] or p.image_variants.get('source') != p.image.name
+        ]
+        # Several products may share one file; render each file once
+        names = sorted({p.image.name for p in products})
+        if not names:
+            self.stdout.write("All product images are up to date.")
+            return
+
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+        manifests = {}
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(generate_variants, name): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    manifests[name] = future.result()
+                except OSError as e:
+                    self.stderr.write(f"Skipping {name}: {e}")
+
+        updated = []
+        for product in products:
+            if product.image.name in manifests:
+                product.image_variants = manifests[product.image.name]
+                updated.append(product)
+        Product.objects.bulk_update(updated, ['image_variants'], batch_size=500)
+        invalidate_catalog()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built derivatives for {len(manifests)} images ({len(updated)} products)."
+        ))
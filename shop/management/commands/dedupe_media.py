@@ -0,0 +1,62 @@
+import posixpath
+from collections import defaultdict
+
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from shop.images import release_image
+from shop.models import OrderItem, Product
+from shop.storage import blob_name, content_hash
+
+
+class Command(BaseCommand):
+    help = "Move product images to content-hash names, merging byte-identical files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report savings without changing anything")
+
+    def handle(self, *args, **options):
+        field = Product._meta.get_field('image')
+        storage, folder = field.storage, field.upload_to.rstrip('/')
+        by_name = defaultdict(list)
+        for product in Product.objects.exclude(image='').only('id', 'image', 'image_variants'):
+            if not storage.is_blob(product.image.name):
+                by_name[product.image.name].append(product)
+
+        moved, merged, saved_bytes = 0, 0, 0
+        stored = set()
+        for name, products in sorted(by_name.items()):
+            if not storage.exists(name):
+                self.stderr.write(f"Skipping missing file {name}")
+                continue
+            with storage.open(name, 'rb') as fh:
+                target = blob_name(folder, content_hash(File(fh)), name)
+                size = storage.size(name)
+                if target in stored or storage.exists(target):
+                    merged += 1
+                    saved_bytes += size
+                elif not options['dry_run']:
+                    target = storage.save(posixpath.join(folder, posixpath.basename(name)), File(fh))
+                stored.add(target)
+            moved += 1
+            if options['dry_run']:
+                continue
+
+            for product in products:
+                product.image.name = target
+                # Old derivatives are named after the old file; rebuilt below
+                product.image_variants = {}
+            Product.objects.bulk_update(products, ['image', 'image_variants'])
+            OrderItem.objects.filter(image=name).update(image=target, image_variants={})
+            release_image(name)
+
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} files; {merged} were duplicates ({saved_bytes / 1024 / 1024:.1f} MB reclaimed)."
+        ))
+        if moved and not options['dry_run']:
+            call_command('build_image_variants', stdout=self.stdout, stderr=self.stderr)
+            # Order lines pick up the rebuilt derivatives of their moved image
+            for product in Product.objects.filter(image__in=stored).only('id', 'image', 'image_variants'):
+                OrderItem.objects.filter(image=product.image.name).update(image_variants=product.image_variants)
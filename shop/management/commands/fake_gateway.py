@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shop.fake_gateway import FakeGateway
+
+
+class Command(BaseCommand):
+    help = "Serve a local fake Razorpay orders API (set RAZORPAY_BASE_URL to its URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        server = FakeGateway(options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(f"Fake gateway listening on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
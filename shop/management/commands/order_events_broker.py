@@ -0,0 +1,25 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from shop.push import serve_broker
+
+
+class Command(BaseCommand):
+    help = (
+        "Relay order updates between processes for the order event streams "
+        "(set ORDER_EVENTS_BROKER_URL to tcp://<host>:<port>)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8766)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f"Order events broker listening on tcp://{options['host']}:{options['port']}"
+        ))
+        try:
+            asyncio.run(serve_broker(options['host'], options['port']))
+        except KeyboardInterrupt:
+            pass
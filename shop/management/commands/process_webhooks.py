@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.webhooks import drain
+
+
+class Command(BaseCommand):
+    help = "Apply pending webhook events from the WebhookEvent inbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Events processed per transaction")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep polling the inbox instead of exiting once it is empty")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            count = drain(options['batch_size'])
+            if count or not options['loop']:
+                self.stdout.write(f"Processed {count} webhook events.")
+            if not options['loop']:
+                return
+            if not count:
+                time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from the Product table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild")
+
+    def handle(self, *args, **options):
+        count = get_search_backend().rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
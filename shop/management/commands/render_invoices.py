@@ -0,0 +1,60 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from shop.invoices import FORMATS, invoice_data, invoice_orders, render_to_cache
+
+
+def month_bounds(month):
+    """'2025-03' -> aware datetimes for the start of March and of April"""
+    try:
+        start = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        raise CommandError(f"--month must look like YYYY-MM, not {month!r}")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def _render_batch(batch, formats):
+    return sum(render_to_cache(data, formats) for data in batch)
+
+
+class Command(BaseCommand):
+    help = "Render (and cache) the PDF and text invoices of every order placed in a month"
+
+    def add_arguments(self, parser):
+        last_month = (date.today().replace(day=1) - date.resolution).strftime('%Y-%m')
+        parser.add_argument('--month', default=last_month, help="YYYY-MM (default: last month)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: one per CPU)")
+        parser.add_argument('--format', choices=sorted(FORMATS), action='append', dest='formats',
+                            help="Only render this format (repeatable; default: all)")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Orders handed to a worker at a time")
+
+    def handle(self, *args, **options):
+        start, end = month_bounds(options['month'])
+        formats = tuple(options['formats'] or FORMATS)
+        orders = invoice_orders().filter(created_at__gte=start, created_at__lt=end).order_by('id')
+        # Workers only render and write files: the data is read here, in
+        # two queries for the whole month, and pickled over to them
+        invoices = [invoice_data(order) for order in orders]
+        if not invoices:
+            self.stdout.write(f"No orders in {options['month']}.")
+            return
+
+        size = options['batch_size']
+        batches = [invoices[i:i + size] for i in range(0, len(invoices), size)]
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            rendered = sum(pool.map(_render_batch, batches, [formats] * len(batches)))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(invoices)} invoices for {options['month']}: "
+            f"rendered {rendered} files, {len(invoices) * len(formats) - rendered} already cached."
+        ))
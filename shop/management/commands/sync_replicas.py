@@ -0,0 +1,38 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto each SQLite replica in DATABASE_REPLICAS "
+        "(a local stand-in for streaming replication)"
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The primary is not SQLite; use the database's own replication")
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if settings.DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3'
+        ]
+        if not replicas:
+            self.stdout.write("No SQLite replicas configured (set SQLITE_REPLICAS).")
+            return
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in replicas:
+                # The backup API copies a consistent snapshot page by page,
+                # and readers of the replica see either the old or new copy
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: copied from {primary['NAME']}")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(replicas)} replica(s)."))
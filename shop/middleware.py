@@ -0,0 +1,101 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import routers
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can sit in an async middleware chain.
+
+    Plain WhiteNoiseMiddleware is sync-only, which makes Django run every
+    request under ASGI through a single thread and undoes the async views.
+    Here only static file hits go to a thread; everything else is awaited
+    straight through.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Read-your-writes for shop.routers.PrimaryReplicaRouter.
+
+    A session that wrote to the database reads everything from the primary
+    for REPLICA_STICKY_SECONDS. Goes after SessionMiddleware; switches
+    itself off when no replicas are configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _has_session(self, request):
+        # Anonymous visitors without a session cookie never load one here
+        return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+    def _pin(self, request, state):
+        # Raw SQL writes (e.g. the cart upserts) never reach the router, so
+        # any unsafe request counts as a write. Only sessions that already
+        # exist are pinned: an anonymous write such as a webhook must not
+        # start a session.
+        wrote = state['wrote'] or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        if wrote and request.session.session_key:
+            return time.time() + settings.REPLICA_STICKY_SECONDS
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pinned_until = request.session.get(routers.PIN_SESSION_KEY, 0) if self._has_session(request) else 0
+        state = routers.start_request(pinned=pinned_until > time.time())
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request()
+        pin = self._pin(request, state)
+        if pin is not None:
+            request.session[routers.PIN_SESSION_KEY] = pin
+        return response
+
+    async def __acall__(self, request):
+        pinned_until = await request.session.aget(routers.PIN_SESSION_KEY, 0) if self._has_session(request) else 0
+        state = routers.start_request(pinned=pinned_until > time.time())
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request()
+        pin = self._pin(request, state)
+        if pin is not None:
+            await request.session.aset(routers.PIN_SESSION_KEY, pin)
+        return response
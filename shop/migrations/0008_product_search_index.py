@@ -0,0 +1,37 @@
+from django.db import migrations
+
+FTS_TABLE = 'shop_product_fts'
+FTS_CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+FTS_DROP_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(FTS_CREATE_SQL)
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) "
+        "SELECT p.id, p.name, COALESCE(p.description, ''), c.name "
+        "FROM shop_product p JOIN shop_category c ON c.id = p.category_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(FTS_DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_order_payment_method_order_shipping_address_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:53
+
+import shop.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(db_index=True, storage=shop.storage.product_image_storage, upload_to='products/'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+def backfill_price_snapshot(apps, schema_editor):
+    # Orders placed before this migration only have the product's current
+    # price to go on; new orders snapshot it at checkout.
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    items = OrderItem.objects.using(schema_editor.connection.alias)
+    batch = []
+    for item in items.select_related('product').iterator(chunk_size=500):
+        price, discount = item.product.price, item.product.discount
+        unit = price - price * discount / 100 if discount > 0 else price
+        item.unit_price = price
+        item.discount = discount
+        item.line_total = unit * item.quantity
+        batch.append(item)
+        if len(batch) >= 500:
+            items.bulk_update(batch, ['unit_price', 'discount', 'line_total'])
+            batch = []
+    items.bulk_update(batch, ['unit_price', 'discount', 'line_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_cart_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='discount',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_price_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def discount_cart_subtotals(apps, schema_editor):
+    # Cart.subtotal used to sum undiscounted prices
+    Cart = apps.get_model('shop', 'Cart')
+    CartItem = apps.get_model('shop', 'CartItem')
+    unit_price = Round(
+        ExpressionWrapper(
+            F('product__price') * (100 - F('product__discount')) * Value(Decimal('0.01')),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+        2,
+    )
+    db_alias = schema_editor.connection.alias
+    lines = CartItem.objects.using(db_alias).filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.using(db_alias).update(
+        subtotal=Coalesce(
+            Subquery(lines.annotate(s=Sum(F('quantity') * unit_price)).values('s')),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_webhookevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(discount_cart_subtotals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:13
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def backfill_sale_price(apps, schema_editor):
+    # Same rounding as shop.pricing.unit_price
+    Product = apps.get_model('shop', 'Product')
+    db_alias = schema_editor.connection.alias
+    products = list(Product.objects.using(db_alias).only('id', 'price', 'discount'))
+    for product in products:
+        product.sale_price = (product.price * (100 - product.discount) / Decimal(100)).quantize(
+            Decimal('0.01'), rounding=ROUND_HALF_UP
+        )
+    Product.objects.using(db_alias).bulk_update(products, ['sale_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_cart_discounted_subtotal'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sale_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_sale_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sale_price'], name='product_sale_price_idx'),
+        ),
+    ]
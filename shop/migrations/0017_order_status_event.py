@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_status_events(apps, schema_editor):
+    # Existing orders only know when they were placed, so their current
+    # status is dated then too
+    Order = apps.get_model('shop', 'Order')
+    OrderStatusEvent = apps.get_model('shop', 'OrderStatusEvent')
+    db_alias = schema_editor.connection.alias
+    events = []
+    for order_id, status, created_at in Order.objects.using(db_alias).values_list('id', 'status', 'created_at').iterator():
+        events.append(OrderStatusEvent(order_id=order_id, status='Pending', created_at=created_at))
+        if status != 'Pending':
+            events.append(OrderStatusEvent(order_id=order_id, status=status, created_at=created_at))
+    OrderStatusEvent.objects.using(db_alias).bulk_create(events, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_product_sale_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='shop.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'created_at'], name='order_status_event_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_status_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:51
+
+import shop.storage
+from django.db import migrations, models
+
+
+def backfill_product_snapshot(apps, schema_editor):
+    # Orders placed before this migration only have the product as it is
+    # now; new orders snapshot it at checkout.
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    items = OrderItem.objects.using(schema_editor.connection.alias)
+    fields = ['product_name', 'image', 'image_variants']
+    batch = []
+    for item in items.select_related('product').iterator(chunk_size=500):
+        item.product_name = item.product.name
+        item.image = item.product.image.name
+        item.image_variants = item.product.image_variants
+        batch.append(item)
+        if len(batch) >= 500:
+            items.bulk_update(batch, fields)
+            batch = []
+    items.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_sqlite_journal_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=shop.storage.product_image_storage, upload_to='products/'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(backfill_product_snapshot, migrations.RunPython.noop),
+    ]
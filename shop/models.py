@@ -1,9 +1,15 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from . import pricing
+from .storage import product_image_storage
+
 # ========================
 # Category Model
 # ========================
@@ -34,28 +40,44 @@ class Product(models.Model):
     slug = models.SlugField(max_length=120, unique=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount = models.PositiveIntegerField(default=0)  # integer discount (%)
+    # price after discount, kept in step by save() so listings can filter/sort on it
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
-    image = models.ImageField(upload_to='products/')
+    # Stored by content hash so identical uploads share one file (see shop.storage)
+    image = models.ImageField(upload_to='products/', storage=product_image_storage, db_index=True)
+    # Resized derivatives of `image`, maintained by shop.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of listings, overall and per category
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_created_idx'),
+            # Listing filters
+            models.Index(fields=['sale_price'], name='product_sale_price_idx'),
+            # Offers page: biggest discount first, cheapest first within it
+            models.Index(fields=['-discount', 'sale_price'], name='product_offers_idx'),
+            models.Index(fields=['rating'], name='product_rating_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        self.sale_price = pricing.unit_price(self.price, self.discount)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'price', 'discount'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'sale_price'}
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} - ₹{self.price}"
 
     def discounted_price(self):
-        """Calculate discounted price based on discount percentage"""
-        if self.discount > 0:
-            discount_amount = self.price * self.discount / 100
-            return self.price - discount_amount
-        return self.price
+        """Price after the discount (stored in sale_price on save)"""
+        return self.sale_price
 
     def discounted_price_display(self):
         """Return formatted discounted price"""
@@ -106,13 +128,57 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # My Orders: one customer's orders, keyset-paginated newest first
+            models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_created_idx'),
+            # Order lookups scoped to the signed-in user (pay_now)
+            models.Index(fields=['user', 'id'], name='order_user_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        # Status as stored, so save() can tell when it changes
+        order._saved_status = order.__dict__.get('status')
+        return order
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        status_changed = (
+            'status' in self.__dict__
+            and (update_fields is None or 'status' in update_fields)
+            and (self._state.adding or self.status != getattr(self, '_saved_status', None))
+        )
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if status_changed:
+                OrderStatusEvent.objects.create(order=self, status=self.status)
+        self._saved_status = self.status if 'status' in self.__dict__ else None
+
     def total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+        return self.items.aggregate(total=models.Sum('line_total'))['total'] or Decimal('0')
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer.user.username}"
 
 
+class OrderStatusEvent(models.Model):
+    """One row per status an order has been in, written by Order.save()"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # The tracking timeline reads one order's events in time order
+            models.Index(fields=['order', 'created_at'], name='order_status_event_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_id} {self.status}"
+
+
 class Payment(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
     razorpay_order_id = models.CharField(max_length=255)
@@ -122,10 +188,39 @@ class Payment(models.Model):
     status = models.CharField(max_length=50, default='created')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # payment_verify and the webhook worker look payments up by gateway order
+            models.Index(fields=['razorpay_order_id'], name='payment_rp_order_idx'),
+        ]
+
     def __str__(self):
         return f"Payment for Order #{self.order.id} - {self.status}"
 
 
+# ========================
+# Webhook Inbox
+# ========================
+class WebhookEvent(models.Model):
+    """Raw gateway webhook, stored on receipt and applied later by shop.webhooks"""
+    event_id = models.CharField(max_length=64, unique=True)
+    event = models.CharField(max_length=100, blank=True)
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker scans for unprocessed events oldest first
+            models.Index(fields=['processed_at', 'id'], name='webhook_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event or 'event'} {self.event_id}"
+
+
 # ========================
 # Order Item Model
 # ========================
@@ -133,18 +228,45 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
     quantity = models.PositiveIntegerField(default=1)
+    # Product snapshot taken when the order was placed, so order history
+    # shows what was bought without joining the product
+    product_name = models.CharField(max_length=100, blank=True, default='')
+    image = models.ImageField(upload_to='products/', storage=product_image_storage, blank=True, db_index=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount = models.PositiveIntegerField(default=0)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     class Meta:
         unique_together = ('order', 'product')
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.unit_price:
+            self.snapshot_product()
+        super().save(*args, **kwargs)
+
+    def snapshot_product(self, product=None):
+        """Copy the product's current name, image, price and discount onto this line"""
+        product = product or self.product
+        self.product_name = product.name
+        self.image = product.image.name
+        self.image_variants = product.image_variants
+        self.unit_price = product.price
+        self.discount = product.discount
+        self.line_total = pricing.line_total(product.price, product.discount, self.quantity)
+
+    def discounted_unit_price(self):
+        """Per-unit price actually charged"""
+        return pricing.unit_price(self.unit_price, self.discount)
+
     def total_price(self):
-        return self.quantity * self.product.discounted_price()
+        return self.line_total
 
     def __str__(self):
-        return f"{self.product.name} x {self.quantity}"
+        return f"{self.product_name} x {self.quantity}"
 
     def discounted_price_display(self):
-        return self.product.discounted_price_display()
+        return f"₹{self.discounted_unit_price():.2f}"
 
 
 # ========================
@@ -158,6 +280,10 @@ class WishlistItem(models.Model):
     class Meta:
         unique_together = ('user', 'product')
         ordering = ['-created_at']
+        indexes = [
+            # The wishlist page lists a user's items newest first
+            models.Index(fields=['user', '-created_at'], name='wishlist_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} ❤ {self.product.name}"
@@ -166,9 +292,12 @@ class WishlistItem(models.Model):
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     updated_at = models.DateTimeField(auto_now=True)
+    # Running totals over `items`, kept in step by shop.cart
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
 
     def __str__(self):
         return f"Cart({self.user.username})"
@@ -187,8 +316,8 @@ class CartItem(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
     def line_total(self):
-        """Calculate total price for this cart item"""
-        return self.product.price * self.quantity
+        """Calculate total price for this cart item, after the product discount"""
+        return pricing.line_total(self.product.price, self.product.discount, self.quantity)
 
 
 # ========================
@@ -0,0 +1,191 @@
+from bisect import bisect_right
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+ZERO = Decimal('0.00')
+
+
+def money(value):
+    """Round to paise, half up (how amounts are printed on an invoice)"""
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def paise(amount):
+    """Integer paise -> Decimal rupees, exactly"""
+    return Decimal(amount).scaleb(-2)
+
+
+# --------------------------
+# Per-line prices
+# --------------------------
+def unit_price(price, discount=0):
+    """Price of one unit after a whole-percent discount, rounded to paise"""
+    price = Decimal(price)
+    if not discount:
+        return money(price)
+    return money(price * (HUNDRED - discount) / HUNDRED)
+
+
+def line_total(price, discount, quantity):
+    """A line is its rounded unit price times the quantity"""
+    return unit_price(price, discount) * quantity
+
+
+# --------------------------
+# Basket pricing
+# --------------------------
+class PricingEngine:
+    """
+    GST slabs and order fees applied to whole baskets.
+
+    `slabs` is a list of (unit price from, GST rate) pairs: a line is taxed at
+    the rate of the highest threshold its discounted unit price reaches, and
+    the rate is split equally into CGST and SGST. `fees` is a list of
+    (name, amount, waived from subtotal or None) flat per-order charges.
+    Tax is rounded once per rate over the basket, not per line, so a basket
+    of many cheap items is not over- or under-charged by rounding.
+    """
+
+    def __init__(self, slabs, fees):
+        slabs = sorted((Decimal(start), Decimal(rate)) for start, rate in slabs)
+        self.slab_starts = [start for start, _ in slabs]
+        self.slab_rates = [rate for _, rate in slabs]
+        self.fees = [
+            (name, int(money(amount) * 100), None if waive_from is None else int(money(waive_from) * 100))
+            for name, amount, waive_from in fees
+        ]
+        self.fee_amounts = {name: paise(amount) for name, amount, _ in self.fees}
+        self._unit_prices = {}
+
+    def rate_for(self, unit):
+        index = bisect_right(self.slab_starts, unit) - 1
+        return self.slab_rates[index] if index >= 0 else ZERO
+
+    def _priced(self, price, discount):
+        # Catalogues repeat the same (price, discount) pairs over and over, so
+        # the rounded unit price (in integer paise) and its slab are worked
+        # out once per pair. Lines are then summed as ints, not Decimals.
+        key = (price, discount)
+        priced = self._unit_prices.get(key)
+        if priced is None:
+            if len(self._unit_prices) > 100000:
+                self._unit_prices.clear()
+            unit = unit_price(price, discount)
+            priced = self._unit_prices[key] = (int(unit * 100), self.rate_for(unit))
+        return priced
+
+    def price(self, lines):
+        """
+        Bill for an iterable of (price, discount, quantity) lines.
+
+        Returns the dict the checkout templates use: subtotal, cgst, sgst,
+        total_gst, gst_rate (None if lines fall in different slabs), one key
+        per fee, and grand_total.
+        """
+        priced = self._priced
+        taxable = {}
+        for price, discount, quantity in lines:
+            unit, rate = priced(price, discount)
+            taxable[rate] = taxable.get(rate, 0) + unit * quantity
+        return self._bill(taxable)
+
+    def price_many(self, rows):
+        """
+        Bills for many baskets in one pass: {key: bill}.
+
+        `rows` is an iterable of (key, price, discount, quantity) sorted by
+        key, e.g. straight from one ordered values_list() query.
+        """
+        priced = self._priced
+        bills = {}
+        key = taxable = None
+        for row_key, price, discount, quantity in rows:
+            if taxable is None or row_key != key:
+                if taxable is not None:
+                    bills[key] = self._bill(taxable)
+                key, taxable = row_key, {}
+            unit, rate = priced(price, discount)
+            taxable[rate] = taxable.get(rate, 0) + unit * quantity
+        if taxable is not None:
+            bills[key] = self._bill(taxable)
+        return bills
+
+    def _bill(self, taxable):
+        # taxable: {rate: amount in paise}. Each rate's half (CGST or SGST) is
+        # rounded half up in integers: round(p / q) == (2p + q) // 2q
+        subtotal = sum(taxable.values())
+        half_tax = 0
+        for rate, amount in taxable.items():
+            numerator, denominator = rate.as_integer_ratio()
+            half_tax += (2 * amount * numerator + 2 * denominator) // (4 * denominator)
+        tax = paise(half_tax)
+        bill = {
+            'subtotal': paise(subtotal),
+            'cgst': tax,
+            'sgst': tax,
+            'total_gst': paise(2 * half_tax),
+            'gst_rate': next(iter(taxable)) if len(taxable) == 1 else None,
+        }
+        grand_total = subtotal + 2 * half_tax
+        for name, amount, waive_from in self.fees:
+            if waive_from is not None and subtotal >= waive_from:
+                bill[name] = ZERO
+            else:
+                bill[name] = self.fee_amounts[name]
+                grand_total += amount
+        bill['grand_total'] = paise(grand_total)
+        return bill
+
+
+_engine = None
+_engine_config = None
+
+
+def engine():
+    """The engine for the current GST_SLABS/ORDER_FEES settings"""
+    global _engine, _engine_config
+    config = (settings.GST_SLABS, settings.ORDER_FEES)
+    if _engine is None or _engine_config != config:
+        _engine = PricingEngine(*config)
+        _engine_config = config
+    return _engine
+
+
+def price_basket(lines):
+    """Bill for (price, discount, quantity) lines; see PricingEngine.price"""
+    return engine().price(lines)
+
+
+# --------------------------
+# Batch repricing
+# --------------------------
+def reprice_carts(carts=None):
+    """
+    Current bills for many carts from live product prices: {cart_id: bill}.
+
+    One query for every line of every cart, however many carts; pass a Cart
+    queryset to limit it (e.g. carts holding a product on promotion).
+    """
+    from .models import CartItem
+
+    items = CartItem.objects.all()
+    if carts is not None:
+        items = items.filter(cart__in=carts)
+    rows = items.order_by('cart_id').values_list(
+        'cart_id', 'product__price', 'product__discount', 'quantity'
+    )
+    return engine().price_many(rows.iterator(chunk_size=5000))
+
+
+def reprice_orders(orders=None):
+    """Bills for many orders from their OrderItem price snapshots: {order_id: bill}"""
+    from .models import OrderItem
+
+    items = OrderItem.objects.all()
+    if orders is not None:
+        items = items.filter(order__in=orders)
+    rows = items.order_by('order_id').values_list('order_id', 'unit_price', 'discount', 'quantity')
+    return engine().price_many(rows.iterator(chunk_size=5000))
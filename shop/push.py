@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Order
+
+
+# --------------------------
+# In-process hub
+# --------------------------
+class Subscription:
+    """One open event stream: a bounded queue read on the stream's own event loop"""
+
+    def __init__(self, maxsize=100):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, message):
+        # A client that stopped reading loses updates rather than growing
+        # memory; it re-syncs from the tracking API when it reconnects
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+
+class Hub:
+    """
+    Fan-out of order updates to the event streams open in this process.
+
+    Streams subscribe by customer (Profile) id; deliver() may be called
+    from any thread and hands the message to each stream's event loop.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, customer_id):
+        subscription = Subscription()
+        with self._lock:
+            self._subscriptions[customer_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, customer_id, subscription):
+        with self._lock:
+            streams = self._subscriptions.get(customer_id)
+            if streams is not None:
+                streams.discard(subscription)
+                if not streams:
+                    del self._subscriptions[customer_id]
+
+    def deliver(self, customer_id, message):
+        with self._lock:
+            streams = list(self._subscriptions.get(customer_id, ()))
+        for subscription in streams:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # That stream's loop has shut down
+                pass
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(streams) for streams in self._subscriptions.values())
+
+
+hub = Hub()
+
+
+# --------------------------
+# Local broker (multi-process)
+# --------------------------
+# With several worker processes, or the webhook worker writing orders in a
+# process of its own, updates have to cross processes. ORDER_EVENTS_BROKER_URL
+# points every process at one `manage.py order_events_broker`, a stand-in
+# for a real message broker: each process sends its updates there and
+# receives everyone's, newline-delimited JSON over one TCP connection.
+async def _broker_connection(reader, writer, writers):
+    writers.add(writer)
+    try:
+        while line := await reader.readline():
+            for peer in list(writers):
+                peer.write(line)
+    except ConnectionError:
+        pass
+    finally:
+        writers.discard(writer)
+        writer.close()
+
+
+async def serve_broker(host, port):
+    writers = set()
+    server = await asyncio.start_server(
+        lambda reader, writer: _broker_connection(reader, writer, writers), host, port,
+    )
+    async with server:
+        await server.serve_forever()
+
+
+class BrokerClient:
+    """
+    This process's connection to the local broker.
+
+    A daemon thread reads everyone's updates and hands them to the hub.
+    While the broker is unreachable, updates are delivered in this process
+    only and the thread keeps reconnecting.
+    """
+
+    def __init__(self, url, reconnect_delay=1.0):
+        parts = urlsplit(url)
+        self.address = (parts.hostname, parts.port)
+        self.reconnect_delay = reconnect_delay
+        self._socket = None
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._run, name='order-events-broker', daemon=True).start()
+
+    def publish(self, customer_id, message):
+        line = json.dumps({'customer': customer_id, 'data': message}).encode() + b'\n'
+        with self._send_lock:
+            if self._socket is not None:
+                try:
+                    self._socket.sendall(line)
+                    return
+                except OSError:
+                    self._socket = None
+        hub.deliver(customer_id, message)
+
+    def _run(self):
+        while True:
+            try:
+                sock = socket.create_connection(self.address, timeout=5)
+            except OSError:
+                time.sleep(self.reconnect_delay)
+                continue
+            sock.settimeout(None)
+            with self._send_lock:
+                self._socket = sock
+            try:
+                with sock.makefile('rb') as lines:
+                    for line in lines:
+                        event = json.loads(line)
+                        hub.deliver(event['customer'], event['data'])
+            except (OSError, ValueError):
+                pass
+            with self._send_lock:
+                if self._socket is sock:
+                    self._socket = None
+            sock.close()
+            time.sleep(self.reconnect_delay)
+
+
+_broker = None
+_broker_pid = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    """This process's BrokerClient, or None when ORDER_EVENTS_BROKER_URL is unset"""
+    global _broker, _broker_pid
+    if not settings.ORDER_EVENTS_BROKER_URL:
+        return None
+    with _broker_lock:
+        if _broker is None or _broker_pid != os.getpid():
+            _broker = BrokerClient(settings.ORDER_EVENTS_BROKER_URL)
+            _broker_pid = os.getpid()
+        return _broker
+
+
+# --------------------------
+# Publishing
+# --------------------------
+def order_message(order_id, status, payment_status):
+    return {'order_id': order_id, 'status': status, 'payment_status': payment_status}
+
+
+def publish(customer_id, message):
+    """Send `message` to every open stream of customer `customer_id`, in any process"""
+    client = broker()
+    if client is not None:
+        client.publish(customer_id, message)
+    else:
+        hub.deliver(customer_id, message)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # customer_id is on the row itself; the user would cost a query per save
+    customer_id = instance.customer_id
+    message = order_message(instance.pk, instance.status, instance.payment_status)
+    transaction.on_commit(lambda: publish(customer_id, message))
+
+
+# --------------------------
+# Event stream
+# --------------------------
+async def event_stream(customer_id):
+    """
+    Server-Sent Events for one customer's orders, until the client goes away.
+
+    An idle stream is one parked coroutine and a comment line every
+    ORDER_EVENTS_KEEPALIVE seconds, so proxies do not time it out.
+    """
+    broker()  # receive updates made in other processes
+    subscription = hub.subscribe(customer_id)
+    try:
+        yield f"retry: {settings.ORDER_EVENTS_RETRY_MS}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), settings.ORDER_EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: order\ndata: {json.dumps(message)}\n\n"
+    finally:
+        hub.unsubscribe(customer_id, subscription)
@@ -0,0 +1,77 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Catalog models: read on the web pages everybody browses, written rarely
+# (admin edits). Everything else, cart, orders, payments, users, sessions,
+# is read where it is written.
+REPLICA_MODELS = {
+    ('shop', 'category'),
+    ('shop', 'product'),
+}
+
+# Writes that say nothing about what the user will read next: a
+# DatabaseCache table (see CACHES) is written on cache misses, which would
+# otherwise pin nearly every session to the primary
+UNPINNED_APP_LABELS = {'django_cache'}
+
+# Session key holding the time until which the session reads from the primary
+PIN_SESSION_KEY = '_db_primary_until'
+
+# Per-request routing state, set by ReplicaRoutingMiddleware: whether reads
+# are pinned to the primary and whether this request has written
+_request_state = ContextVar('db_routing_state', default=None)
+
+
+def start_request(pinned):
+    state = {'pinned': pinned, 'wrote': False}
+    _request_state.set(state)
+    return state
+
+
+def end_request():
+    _request_state.set(None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Catalog reads go to a replica in settings.DATABASE_REPLICAS; all writes,
+    and all other reads, go to the primary (`default`).
+
+    Reads stay on the primary after a write: for the rest of the request,
+    and for REPLICA_STICKY_SECONDS afterwards for the same session, so a
+    user sees their own changes while the replicas catch up. Reads inside a
+    transaction on the primary stay there too, so checkout prices come from
+    the database the order is written to.
+    """
+
+    def _replicas(self):
+        return settings.DATABASE_REPLICAS
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas or (model._meta.app_label, model._meta.model_name) not in REPLICA_MODELS:
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        if state is not None and state['pinned']:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.app_label not in UNPINNED_APP_LABELS:
+            state['wrote'] = state['pinned'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with the data from the primary
+        return db not in self._replicas()
+
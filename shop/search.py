@@ -0,0 +1,177 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Category, Product
+
+FTS_TABLE = 'shop_product_fts'
+
+# Schema shared by the migration and `rebuild_search_index`. rowid is the
+# product id; the prefix indexes make "sof*"-style lookups index seeks.
+FTS_CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+FTS_DROP_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+
+def tokenize(query):
+    """Split free text into lowercase word tokens"""
+    return re.findall(r'\w+', query.lower())
+
+
+# ========================
+# Backends
+# ========================
+class IcontainsSearchBackend:
+    """Portable fallback: OR'd icontains over name, description and category"""
+
+    def search(self, query, limit=None):
+        query = query.strip()
+        if not query:
+            return []
+        results = Product.objects.filter(
+            name__icontains=query
+        ) | Product.objects.filter(
+            description__icontains=query
+        ) | Product.objects.filter(
+            category__name__icontains=query
+        )
+        results = results.distinct()
+        if limit:
+            results = results[:limit]
+        return list(results)
+
+    def index_products(self, products, using='default'):
+        pass
+
+    def remove_products(self, product_ids, using='default'):
+        pass
+
+    def rebuild(self, using='default'):
+        return 0
+
+
+class SQLiteFTSSearchBackend(IcontainsSearchBackend):
+    """
+    SQLite FTS5 index over product name, description and category name.
+
+    Results are ranked with bm25 (name matches weigh most, then category,
+    then description) and every token is prefix-matched, so "wood sof"
+    finds "Wooden Sofa". Falls back to icontains on other databases.
+    """
+    # bm25 column weights, in FTS table column order
+    weights = (10.0, 1.0, 4.0)
+
+    def _enabled(self, using):
+        return connections[using].vendor == 'sqlite'
+
+    def match_expression(self, query):
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, query, limit=None):
+        using = router.db_for_read(Product)
+        if not self._enabled(using):
+            return super().search(query, limit)
+
+        match = self.match_expression(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s)"
+        )
+        params = [match, *self.weights]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+
+        products = Product.objects.using(using).in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+    def index_products(self, products, using='default'):
+        if not self._enabled(using):
+            return
+        rows = [
+            (p.pk, p.name, p.description or '', p.category.name)
+            for p in products
+        ]
+        if not rows:
+            return
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                [(row[0],) for row in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove_products(self, product_ids, using='default'):
+        if not self._enabled(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                [(pk,) for pk in product_ids],
+            )
+
+    def rebuild(self, using='default'):
+        if not self._enabled(using):
+            return 0
+        with connections[using].cursor() as cursor:
+            cursor.execute(FTS_DROP_SQL)
+            cursor.execute(FTS_CREATE_SQL)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) "
+                "SELECT p.id, p.name, COALESCE(p.description, ''), c.name "
+                "FROM shop_product p JOIN shop_category c ON c.id = p.category_id"
+            )
+            return cursor.rowcount
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Return the backend configured by settings.SEARCH_BACKEND"""
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+def search_products(query, limit=None):
+    if limit is None:
+        limit = settings.SEARCH_RESULTS_LIMIT
+    return get_search_backend().search(query, limit=limit)
+
+
+# ========================
+# Index maintenance signals
+# ========================
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    get_search_backend().index_products([instance], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using='default', **kwargs):
+    get_search_backend().remove_products([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, raw=False, using='default', **kwargs):
+    # A renamed category changes the indexed text of all of its products
+    if raw or created:
+        return
+    products = instance.products.using(using).select_related('category')
+    get_search_backend().index_products(products, using=using)
@@ -0,0 +1,47 @@
+import hashlib
+import hmac
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# --------------------------
+# Razorpay HMAC-SHA256 signatures
+# --------------------------
+@lru_cache(maxsize=8)
+def _keyed_hmac(secret):
+    """
+    HMAC-SHA256 primed with `secret`.
+
+    Hashing the padded key is done once here; each check copies this
+    object, which costs less than building a fresh HMAC from the key.
+    """
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+
+def sign(message, secret):
+    """Hex HMAC-SHA256 of `message` (str or bytes) under `secret`"""
+    mac = _keyed_hmac(secret).copy()
+    mac.update(message.encode() if isinstance(message, str) else message)
+    return mac.hexdigest()
+
+
+def verify(message, signature, secret):
+    """Constant-time check of a hex signature; False for missing input"""
+    if not secret or not signature:
+        return False
+    # As bytes: compare_digest refuses str with non-ASCII characters
+    expected = sign(message, secret).encode()
+    return hmac.compare_digest(expected, str(signature).encode('utf-8', 'surrogatepass'))
+
+
+def verify_payment_signature(order_id, payment_id, signature, secret=None):
+    """Checkout callback: signature over "<order_id>|<payment_id>" with the key secret"""
+    secret = settings.RAZORPAY_KEY_SECRET if secret is None else secret
+    return verify(f"{order_id}|{payment_id}", signature, secret)
+
+
+def verify_webhook_signature(body, signature, secret=None):
+    """Webhook: signature over the raw request body with the webhook secret"""
+    secret = settings.RAZORPAY_WEBHOOK_SECRET if secret is None else secret
+    return verify(body, signature, secret)
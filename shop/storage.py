@@ -0,0 +1,77 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash(content):
+    """sha256 hex digest of a File, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(folder, digest, original_name):
+    """products/ + <digest> -> products/ab/<digest>.png (two-char fan-out)"""
+    ext = os.path.splitext(original_name)[1].lower()
+    return posixpath.join(folder, digest[:2], f"{digest}{ext}")
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    File system storage that names every file by the sha256 of its bytes.
+
+    Uploading a file that is already stored returns the existing name
+    without writing anything, so identical images share one blob. Blobs are
+    only removed through `release`, once nothing references them any more.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        folder = posixpath.dirname(name)
+        name = blob_name(folder, content_hash(content), name)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+    def is_blob(self, name):
+        """True if `name` already follows the content-hash layout"""
+        folder, filename = posixpath.split(name)
+        digest = os.path.splitext(filename)[0]
+        return (
+            len(digest) == 64
+            and posixpath.basename(folder) == digest[:2]
+            and all(c in '0123456789abcdef' for c in digest)
+        )
+
+    def release(self, name, references):
+        """
+        Drop one reference to `name`; `references` is how many remain.
+
+        The blob and its derivatives ("<stem>.<hash>.<width>w.<ext>" beside
+        it, see shop.images.variant_name) are deleted when the count reaches
+        zero.
+        """
+        if references > 0 or not name or not self.exists(name):
+            return False
+        folder, filename = posixpath.split(name)
+        stem = os.path.splitext(filename)[0]
+        derivative = re.compile(re.escape(stem) + r'\.[0-9a-f]{12}\.\d+w\.[a-z]+$')
+        _, files = self.listdir(folder)
+        for other in files:
+            if derivative.match(other):
+                self.delete(posixpath.join(folder, other))
+        self.delete(name)
+        return True
+
+
+def product_image_storage():
+    return ContentHashStorage()
@@ -0,0 +1,125 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .catalog import catalog_version
+from .models import Category, Product
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index over product and category names.
+
+    Every word position of a name is stored as a key ("chesterfield sofa",
+    "sofa"), so a prefix lookup is one bisect plus a short forward scan.
+    """
+
+    def __init__(self, entries):
+        # entries: iterable of dicts with 'label', 'type' and 'url'
+        self.entries = list(entries)
+        keys = []
+        for position, entry in enumerate(self.entries):
+            label = entry['label'].lower()
+            start = 0
+            for word in label.split():
+                start = label.index(word, start)
+                keys.append((label[start:], position))
+                start += len(word)
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.positions = [position for _, position in keys]
+
+    def lookup(self, prefix, limit=8):
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            position = self.positions[i]
+            if position not in seen:
+                seen.add(position)
+                results.append(self.entries[position])
+                if len(results) >= limit:
+                    break
+            i += 1
+        return results
+
+
+def build_index():
+    entries = [
+        {
+            'label': name,
+            'type': 'category',
+            'url': reverse('products_by_category', args=[slug]),
+        }
+        for name, slug in Category.objects.order_by('name').values_list('name', 'slug')
+    ]
+    entries += [
+        {
+            'label': name,
+            'type': 'product',
+            'url': reverse('product_detail', args=[pk]),
+        }
+        for pk, name in Product.objects.order_by('name').values_list('id', 'name')
+    ]
+    return PrefixIndex(entries)
+
+
+# --------------------------
+# Per-process index
+# --------------------------
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+# This process's last reading of the catalog version, in the per-process
+# `local` cache so a keystroke does not go to `default` every time
+VERSION_CHECK_KEY = 'shop:suggest:catalog-version'
+
+
+def _catalog_version():
+    """The catalog version, looked up at most every SUGGEST_VERSION_CHECK_INTERVAL seconds"""
+    local = caches['local']
+    version = local.get(VERSION_CHECK_KEY)
+    if version is None:
+        version = catalog_version()
+        local.set(VERSION_CHECK_KEY, version, settings.SUGGEST_VERSION_CHECK_INTERVAL)
+    return version
+
+
+def get_index():
+    """
+    Return this process's index, rebuilding it lazily when the catalog
+    version (bumped by Product/Category signals) has moved on.
+
+    A change saved by this process is picked up by the next lookup; one
+    saved by another worker within SUGGEST_VERSION_CHECK_INTERVAL seconds
+    of it reaching `default` (see CATALOG_VERSION_TIMEOUT without Redis).
+    """
+    global _index, _index_version
+    version = _catalog_version()
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                _index = build_index()
+                _index_version = version
+    return _index
+
+
+def suggest(prefix, limit=8):
+    return get_index().lookup(prefix, limit)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    caches['local'].delete(VERSION_CHECK_KEY)
@@ -0,0 +1,49 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from shop.images import FORMATS
+
+register = template.Library()
+
+MIME_TYPES = {ext: mime for ext, _, mime, _ in FORMATS}
+
+
+@register.simple_tag
+def product_srcset(product, ext='jpg'):
+    """srcset value ("url 320w, url 640w") for one derivative format"""
+    variants = (product.image_variants or {}).get('formats', {}).get(ext, {})
+    return ', '.join(
+        f"{default_storage.url(name)} {width}w"
+        for width, name in sorted(variants.items(), key=lambda item: int(item[0]))
+    )
+
+
+@register.simple_tag
+def product_picture(product, sizes='(max-width: 600px) 100vw, 320px', alt=None, css_class=''):
+    """
+    <picture> for a product image with AVIF/WebP sources and a JPEG srcset.
+
+    Falls back to a plain <img> of the original until derivatives exist.
+    """
+    alt = product.name if alt is None else alt
+    formats = (product.image_variants or {}).get('formats', {})
+    if not formats.get('jpg'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+            product.image.url, alt, css_class,
+        )
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[ext], product_srcset(product, ext), sizes)
+            for ext in ('avif', 'webp') if formats.get(ext)
+        ),
+    )
+    jpeg = formats['jpg']
+    fallback = default_storage.url(jpeg[min(jpeg, key=int)])
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        sources, fallback, product_srcset(product, 'jpg'), sizes, alt, css_class,
+    )
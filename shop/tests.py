@@ -1,3 +1,1748 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import math
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+from importlib import import_module
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+import httpx
+import razorpay
+from PIL import Image as PILImage
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cache import SessionStore as CacheSession
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models.signals import post_save
+from django.http import FileResponse, HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from . import (
+    catalog, dbmetrics, gateway, images, invoices, pricing, push, routers, search, signatures, suggest, tracking,
+    webhooks,
+)
+from .catalog import CATALOG_VERSION_KEY
+from .cart import CartState, add_item, cart_count, decrement_item, remove_item
+from .checkout import EmptyCheckout, checkout_cart, create_order
+from .fake_gateway import FakeGateway
+from .middleware import ReplicaRoutingMiddleware
+from .models import (
+    Cart, CartItem, Category, Order, OrderStatusEvent, Payment, Product, WebhookEvent, WishlistItem,
+)
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .pricing import price_basket
+from .views import OFFER_ORDERINGS
+
+
+@skipUnless(connection.vendor == 'sqlite', "Checks SQLite's EXPLAIN QUERY PLAN output")
+class HotQueryIndexTests(TestCase):
+    """The queries behind the busiest pages are answered from an index, without a sort"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'x')
+        cls.category = Category.objects.create(name='Sofas')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Sofa', price=Decimal('1000.00'), discount=10, image='products/sofa.png',
+        )
+        cls.order = Order.objects.create(customer=cls.user.profile, user=cls.user)
+        Payment.objects.create(order=cls.order, razorpay_order_id='order_test')
+        WishlistItem.objects.create(user=cls.user, product=cls.product)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_my_orders(self):
+        orders = Order.objects.filter(customer=self.user.profile).order_by('-created_at', '-pk')
+        self.assertUsesIndex(orders[:11], 'order_customer_created_idx')
+        # Later pages seek past the cursor
+        older = orders.filter(created_at__lt=self.order.created_at)
+        self.assertUsesIndex(older[:11], 'order_customer_created_idx')
+
+    def test_user_order_lookup(self):
+        plan = Order.objects.filter(id=self.order.id, user=self.user).explain()
+        self.assertIn('SEARCH shop_order', plan)
+        self.assertNotIn('SCAN', plan)
+        self.assertUsesIndex(Order.objects.filter(user=self.user).order_by('id'), 'order_user_idx')
+
+    def test_payment_by_gateway_order(self):
+        self.assertUsesIndex(Payment.objects.filter(razorpay_order_id='order_test'), 'payment_rp_order_idx')
+        # The webhook worker's order update joins through the same column
+        self.assertUsesIndex(
+            Order.objects.filter(payments__razorpay_order_id='order_test'), 'payment_rp_order_idx',
+        )
+
+    def test_offers(self):
+        indexes = {
+            'discount': 'product_offers_idx',
+            'price': 'product_sale_price_idx',
+            '-price': 'product_sale_price_idx',
+        }
+        for sort, ordering in OFFER_ORDERINGS.items():
+            with self.subTest(sort=sort):
+                products = Product.objects.filter(discount__gt=0).order_by(*ordering)[:24]
+                self.assertUsesIndex(products, indexes[sort])
+
+    def test_category_listing(self):
+        products = Product.objects.filter(category=self.category).order_by('-created_at', '-pk')[:25]
+        self.assertUsesIndex(products, 'product_cat_created_idx')
+
+    def test_wishlist(self):
+        self.assertUsesIndex(WishlistItem.objects.filter(user=self.user), 'wishlist_user_created_idx')
+
+    def test_order_tracking(self):
+        events = OrderStatusEvent.objects.filter(order=self.order).order_by('created_at')
+        self.assertUsesIndex(events, 'order_status_event_idx')
+
+
+# --------------------------
+# Product image blobs
+# --------------------------
+def png(color, size=(4, 4)):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', size, color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='photo.png')
+
+
+class ImageReleaseTests(TestCase):
+    """Content-hash blobs are deleted after commit, once nothing references them"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name, PRODUCT_IMAGE_WIDTHS=[]))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Chairs')
+
+    def product(self, name, image):
+        return Product.objects.create(category=self.category, name=name, price=Decimal('100'), image=image)
+
+    def stored(self, name):
+        return Product._meta.get_field('image').storage.exists(name)
+
+    def test_deleted_after_commit(self):
+        product = self.product('Red chair', png('red'))
+        name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            product.delete()
+            self.assertTrue(self.stored(name))
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(self.stored(name))
+
+    def test_kept_on_rollback(self):
+        product = self.product('Red chair', png('red'))
+        name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                product.image = png('blue')
+                product.save()
+                transaction.set_rollback(True)
+        product.refresh_from_db()
+        self.assertEqual(product.image.name, name)
+        self.assertTrue(self.stored(name))
+
+    def test_kept_while_shared(self):
+        first = self.product('Red chair', png('red'))
+        second = self.product('Red stool', png('red'))
+        self.assertEqual(first.image.name, second.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(self.stored(second.image.name))
+
+    def test_references_counted_at_commit(self):
+        product = self.product('Red chair', png('red'))
+        name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+            # Same content uploaded again before the delete commits
+            self.product('Red bench', png('red'))
+        self.assertTrue(self.stored(name))
+
+    def test_kept_while_ordered(self):
+        user = User.objects.create_user('buyer')
+        product = self.product('Red chair', png('red'))
+        name = product.image.name
+        order = create_order(user, [(product.id, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = png('blue')
+            product.save()
+        self.assertEqual(order.items.get().image.name, name)
+        self.assertTrue(self.stored(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        self.assertFalse(self.stored(name))
+
+
+@override_settings(PRODUCT_IMAGE_WIDTHS=[8, 16, 64])
+class ImageVariantTests(TestCase):
+    """Saving a product writes resized derivatives; unusable originals are skipped"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Rugs')
+
+    def product(self, image, name='Rug'):
+        return Product.objects.create(category=self.category, name=name, price=Decimal('100'), image=image)
+
+    def stored_files(self):
+        return sorted(str(path.relative_to(self.media.name)) for path in Path(self.media.name).rglob('*.*'))
+
+    def picture(self, product):
+        return Template('{% load product_images %}{% product_picture product %}').render(Context({'product': product}))
+
+    def test_variants_written_on_save(self):
+        product = self.product(png('red', size=(100, 50)))
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, variants)
+        self.assertEqual(set(variants['formats']), {ext for ext, *_ in images.available_formats()})
+        for ext, widths in variants['formats'].items():
+            self.assertEqual(set(widths), {'8', '16', '64'})
+        with default_storage.open(variants['formats']['jpg']['16']) as fh, PILImage.open(fh) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (16, 8)))
+
+    def test_never_upscaled(self):
+        product = self.product(png('red', size=(20, 20)))
+        self.assertEqual(set(product.image_variants['formats']['jpg']), {'8', '16', '20'})
+
+    def test_transparency_on_white(self):
+        buffer = io.BytesIO()
+        PILImage.new('RGBA', (16, 16), (0, 0, 0, 0)).save(buffer, 'PNG')
+        product = self.product(ContentFile(buffer.getvalue(), name='clear.png'))
+        with default_storage.open(product.image_variants['formats']['jpg']['16']) as fh, PILImage.open(fh) as image:
+            self.assertGreater(min(image.getpixel((8, 8))), 250)
+
+    def test_existing_variants_reused(self):
+        first = self.product(png('blue', size=(32, 32)))
+        files = self.stored_files()
+        second = self.product(png('blue', size=(32, 32)), name='Blue rug')
+        self.assertEqual(second.image_variants, first.image_variants)
+        self.assertEqual(self.stored_files(), files)
+
+    def test_regenerated_only_when_the_image_changes(self):
+        product = self.product(png('red', size=(32, 32)))
+        variants = product.image_variants
+        # A save that keeps the image does not look at the derivatives again
+        default_storage.delete(variants['formats']['jpg']['8'])
+        product.name = 'Red rug'
+        product.save()
+        self.assertFalse(default_storage.exists(variants['formats']['jpg']['8']))
+        images.refresh_product_images(product, force=True)
+        self.assertTrue(default_storage.exists(variants['formats']['jpg']['8']))
+        product.image = png('green', size=(32, 32))
+        product.save()
+        self.assertNotEqual(product.image_variants['hash'], variants['hash'])
+        self.assertEqual(product.image_variants['source'], product.image.name)
+
+    def test_unusable_originals_are_skipped(self):
+        missing = self.product('products/missing.png')
+        broken = self.product(ContentFile(b'not an image', name='broken.png'), name='Broken rug')
+        for product in (missing, broken):
+            self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {})
+        # The page falls back to the original image
+        html = self.picture(broken)
+        self.assertTrue(html.startswith(f'<img src="{broken.image.url}"'))
+
+    def test_picture_sources(self):
+        product = self.product(png('red', size=(100, 50)))
+        html = self.picture(product)
+        self.assertTrue(html.startswith('<picture>'))
+        jpeg = product.image_variants['formats']['jpg']
+        self.assertIn(f'src="{default_storage.url(jpeg["8"])}"', html)
+        self.assertIn(f'{default_storage.url(jpeg["64"])} 64w', html)
+        for ext, _, mime, _ in images.available_formats():
+            if ext != 'jpg':
+                self.assertIn(f'<source type="{mime}"', html)
+
+
+# --------------------------
+# Catalog cache version
+# --------------------------
+class CatalogVersionTests(TestCase):
+    """The home page fragments' version changes with the catalog, without database queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Lamps')
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_bumped_by_catalog_changes(self):
+        version = catalog.catalog_version()
+        Product.objects.create(category=self.category, name='Floor lamp', price=Decimal('800'))
+        self.assertNotEqual(catalog.catalog_version(), version)
+
+    def test_expired_version_is_not_reused(self):
+        version = catalog.catalog_version()
+        # What CATALOG_VERSION_TIMEOUT does to a worker's copy
+        caches['default'].delete(CATALOG_VERSION_KEY)
+        self.assertNotEqual(catalog.catalog_version(), version)
+
+    def test_read_without_queries(self):
+        with self.assertNumQueries(0):
+            catalog.catalog_version()
+            catalog.invalidate_catalog()
+            catalog.catalog_version()
+
+
+# --------------------------
+# Product listings
+# --------------------------
+class ListingPaginationTests(TestCase):
+    """Listings page newest first by (created_at, id) cursors, without gaps or repeats"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chairs = Category.objects.create(name='Chairs')
+        cls.beds = Category.objects.create(name='Beds')
+        cls.products = [
+            Product.objects.create(
+                category=cls.chairs if n % 2 else cls.beds, name=f'Item {n}',
+                price=Decimal(100 * (n + 1)), image='products/p.png',
+            )
+            for n in range(7)
+        ]
+
+    def walk(self, page_size, **kwargs):
+        """Every page's product ids, following next_cursor to the end"""
+        pages, cursor = [], None
+        while True:
+            products, cursor = catalog.product_listing(cursor=cursor, page_size=page_size, **kwargs)
+            pages.append([product.id for product in products])
+            if cursor is None:
+                return pages
+
+    def newest_first(self, products):
+        return [p.id for p in sorted(products, key=lambda p: (p.created_at, p.id), reverse=True)]
+
+    def test_cursor_round_trip(self):
+        product = self.products[3]
+        cursor = encode_cursor(product)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), (product.created_at, product.id))
+
+    def test_malformed_cursors(self):
+        for cursor in ('', 'not base64!', encode_cursor(self.products[0])[:-3], 'bm8tc2VwYXJhdG9y',
+                       'MjAyNS0wMS0wMXx4', 'bm90LWEtZGF0ZXwx'):
+            self.assertIsNone(decode_cursor(cursor), cursor)
+        # A bad cursor starts again from the first page
+        first, _ = catalog.product_listing(page_size=3)
+        again, _ = catalog.product_listing(cursor='garbage', page_size=3)
+        self.assertEqual(again, first)
+
+    def test_pages_cover_the_listing_once(self):
+        pages = self.walk(page_size=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.newest_first(self.products))
+
+    def test_full_last_page_has_no_next_cursor(self):
+        Product.objects.filter(pk=self.products[0].pk).delete()
+        self.assertEqual([len(page) for page in self.walk(page_size=3)], [3, 3])
+
+    def test_same_timestamp_pages_by_id(self):
+        Product.objects.update(created_at=self.products[0].created_at)
+        pages = self.walk(page_size=2)
+        self.assertEqual(sum(pages, []), sorted((p.id for p in self.products), reverse=True))
+
+    def test_filters_and_category(self):
+        pages = self.walk(page_size=2, category=self.chairs, filters={'min_price': Decimal('300')})
+        expected = [p for p in self.products if p.category == self.chairs and p.price >= 300]
+        self.assertEqual(sum(pages, []), self.newest_first(expected))
+
+    @override_settings(PRODUCTS_PER_PAGE=2)
+    def test_next_link_keeps_filters(self):
+        response = self.client.get(reverse('all_products'), {'min_price': '200', 'cursor': 'x'})
+        self.assertEqual(response.context['filter_query'], 'min_price=200')
+        _, cursor = keyset_page(Product.objects.filter(sale_price__gte=200), page_size=2)
+        self.assertIsNotNone(cursor)
+        self.assertEqual(response.context['next_cursor'], cursor)
+        response = self.client.get(reverse('all_products'), {'min_price': '200', 'cursor': cursor})
+        self.assertEqual([p.id for p in response.context['products']], self.newest_first(
+            [p for p in self.products if p.price >= 200]
+        )[2:4])
+
+
+# --------------------------
+# Product search
+# --------------------------
+@skipUnless(connection.vendor == 'sqlite', "Searches the SQLite FTS5 index")
+class ProductSearchTests(TestCase):
+    """Ranked, prefix-matched search over the FTS index, and the icontains fallback"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sofas = Category.objects.create(name='Sofas')
+        cls.tables = Category.objects.create(name='Tables')
+        cls.wooden_sofa = cls.product(cls.sofas, 'Wooden Sofa', 'Three seater')
+        cls.side_table = cls.product(cls.tables, 'Side table', 'Pairs well with any sofa')
+        cls.armchair = cls.product(cls.sofas, 'Armchair', 'Crème fabric')
+
+    @staticmethod
+    def product(category, name, description):
+        return Product.objects.create(
+            category=category, name=name, description=description, price=Decimal('100'), image='products/p.png',
+        )
+
+    def names(self, query, backend=None):
+        backend = backend or search.SQLiteFTSSearchBackend()
+        return [product.name for product in backend.search(query)]
+
+    def test_name_matches_rank_first(self):
+        # Name beats category beats description
+        self.assertEqual(self.names('sofa'), ['Wooden Sofa', 'Armchair', 'Side table'])
+
+    def test_every_token_is_a_prefix(self):
+        self.assertEqual(self.names('wood sof'), ['Wooden Sofa'])
+        self.assertEqual(self.names('sid tab'), ['Side table'])
+        self.assertEqual(self.names('wood table'), [])
+
+    def test_accents_and_punctuation(self):
+        self.assertEqual(self.names('creme'), ['Armchair'])
+        self.assertEqual(self.names('"sofa" OR'), self.names('sofa or'))
+        self.assertEqual(self.names('  !! '), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.wooden_sofa.name = 'Teak Sofa'
+        self.wooden_sofa.save()
+        self.assertEqual(self.names('teak'), ['Teak Sofa'])
+        self.assertEqual(self.names('wooden'), [])
+        self.side_table.delete()
+        self.assertNotIn('Side table', self.names('sofa'))
+
+    def test_category_rename_reindexes_its_products(self):
+        self.tables.name = 'Desks'
+        self.tables.save()
+        self.assertEqual(self.names('desk'), ['Side table'])
+
+    def test_limit(self):
+        self.assertEqual(len(search.SQLiteFTSSearchBackend().search('sofa', limit=2)), 2)
+
+    def test_icontains_fallback(self):
+        fallback = search.IcontainsSearchBackend()
+        # Substring matches on name, description or category, each product once
+        self.assertCountEqual(self.names('sof', fallback), ['Wooden Sofa', 'Side table', 'Armchair'])
+        self.assertEqual(self.names('seater', fallback), ['Wooden Sofa'])
+        self.assertEqual(len(fallback.search('sofa', limit=1)), 1)
+        self.assertEqual(self.names('   ', fallback), [])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search_products'), {'q': 'wood sof'})
+        self.assertEqual([p.name for p in response.context['search_results']], ['Wooden Sofa'])
+
+
+# --------------------------
+# Search suggestions
+# --------------------------
+class SuggestIndexTests(TestCase):
+    """The per-process prefix index follows the shared catalog version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Desks')
+
+    def setUp(self):
+        for backend in caches.all():
+            backend.clear()
+
+    def labels(self, prefix):
+        return [entry['label'] for entry in suggest.suggest(prefix)]
+
+    def test_refreshed_when_products_change(self):
+        self.assertEqual(self.labels('walnut'), [])
+        Product.objects.create(category=self.category, name='Walnut desk', price=Decimal('5000'))
+        self.assertEqual(self.labels('walnut'), ['Walnut desk'])
+
+    def test_refreshed_when_another_process_bumps_the_version(self):
+        self.labels('desk')
+        # What a save in another worker does to the shared cache
+        Product.objects.bulk_create([
+            Product(category=self.category, name='Teak desk', slug='teak-desk', price=Decimal('4000')),
+        ])
+        caches['default'].incr(CATALOG_VERSION_KEY)
+        # Seen once this process checks the version again
+        self.assertEqual(self.labels('teak'), [])
+        caches['local'].delete(suggest.VERSION_CHECK_KEY)
+        self.assertIn('Teak desk', self.labels('teak'))
+
+    def test_warm_index_makes_no_queries(self):
+        Product.objects.create(category=self.category, name='Oak desk', price=Decimal('3000'))
+        self.labels('oak')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('search_suggest'), {'q': 'oak'})
+        self.assertEqual([entry['label'] for entry in response.json()['suggestions']], ['Oak desk'])
+
+
+# --------------------------
+# Read replicas
+# --------------------------
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Catalog reads go to a replica unless the session or transaction has written"""
+
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        self.addCleanup(routers.end_request)
+
+    def test_catalog_reads_go_to_a_replica(self):
+        routers.start_request(pinned=False)
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+        self.assertEqual(self.router.db_for_read(Category), 'replica1')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    def test_write_pins_the_rest_of_the_request(self):
+        routers.start_request(pinned=False)
+        self.router.db_for_write(Order)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_cache_table_writes_do_not_pin(self):
+        state = routers.start_request(pinned=False)
+        self.router.db_for_write(DatabaseCache('shop_cache', {}).cache_model_class)
+        self.assertFalse(state['wrote'])
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+
+    def test_reads_in_an_atomic_block_stay_on_the_primary(self):
+        routers.start_request(pinned=False)
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+
+    def middleware_request(self, method, session):
+        """Run one request through ReplicaRoutingMiddleware; returns where it read products"""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session.session_key
+        request.session = session
+        ReplicaRoutingMiddleware(view)(request)
+        return reads[0]
+
+    def test_session_sticks_to_the_primary_after_a_write(self):
+        session = CacheSession()
+        session.create()
+        self.assertEqual(self.middleware_request('get', session), 'replica1')
+        self.assertNotIn(routers.PIN_SESSION_KEY, session)
+
+        self.assertEqual(self.middleware_request('post', session), 'replica1')
+        self.assertGreater(session[routers.PIN_SESSION_KEY], time.time() + 9)
+        self.assertEqual(self.middleware_request('get', session), 'default')
+
+        # Once the sticky window has passed
+        session[routers.PIN_SESSION_KEY] = time.time() - 1
+        self.assertEqual(self.middleware_request('get', session), 'replica1')
+
+
+# --------------------------
+# Order tracking
+# --------------------------
+class OrderTrackingTests(TestCase):
+    """Polls revalidate against the cached snapshot until the status changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tracker', 'tracker@example.com', 'x')
+        cls.order = Order.objects.create(customer=cls.user.profile, user=cls.user)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(self.user)
+        self.url = reverse('order_status_api', args=[self.order.id])
+
+    def test_not_modified_until_status_changes(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = Order.STATUS_SHIPPED
+            self.order.save()
+        changed = self.client.get(self.url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(json.loads(changed.content)['currentStatus'], 'Shipped')
+
+    def test_snapshot_is_in_the_shared_cache(self):
+        self.client.get(self.url)
+        self.assertIsNotNone(caches['default'].get(tracking.tracking_key(self.order.id)))
+
+    def test_cached_polls_make_no_order_queries(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            tracking.order_tracking(self.order.id)
+        # Only the session and user lookups of the login
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_users_order(self):
+        other = User.objects.create_user('other', 'other@example.com', 'x')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+# --------------------------
+# Pricing
+# --------------------------
+SLABS = [('0', '0.05'), ('1000', '0.12'), ('2500', '0.18')]
+FEES = [('delivery_charge', '50.00', '500.00'), ('packaging_charge', '20.00', None)]
+
+
+class PricingTests(SimpleTestCase):
+    """GST slabs, paise rounding and order fees"""
+
+    def setUp(self):
+        self.engine = pricing.PricingEngine(SLABS, FEES)
+
+    def test_unit_price_rounds_half_up(self):
+        self.assertEqual(pricing.unit_price('10.05', 50), Decimal('5.03'))  # 5.025
+        self.assertEqual(pricing.unit_price('99.99', 15), Decimal('84.99'))  # 84.9915
+        self.assertEqual(pricing.unit_price('100', 0), Decimal('100.00'))
+        self.assertEqual(pricing.line_total('10.05', 50, 3), Decimal('15.09'))
+
+    def test_slab_boundaries(self):
+        for unit, rate in (('0.01', '0.05'), ('999.99', '0.05'), ('1000.00', '0.12'),
+                           ('2499.99', '0.12'), ('2500.00', '0.18'), ('99999', '0.18')):
+            with self.subTest(unit=unit):
+                self.assertEqual(self.engine.rate_for(Decimal(unit)), Decimal(rate))
+
+    def test_slab_is_chosen_on_the_discounted_price(self):
+        bill = self.engine.price([(Decimal('1100.00'), 10, 1)])  # 990.00
+        self.assertEqual(bill['gst_rate'], Decimal('0.05'))
+        self.assertEqual(bill['total_gst'], Decimal('49.50'))
+        self.assertEqual(bill['cgst'], bill['sgst'])
+
+    def test_tax_rounded_once_per_rate(self):
+        # 5% of 0.10 is 0.005 a line (0.0025 each for CGST and SGST), which
+        # would round away line by line; over the basket it is 0.015
+        bill = self.engine.price([(Decimal('0.10'), 0, 1)] * 3)
+        self.assertEqual(bill['cgst'], Decimal('0.01'))
+        self.assertEqual(bill['total_gst'], Decimal('0.02'))
+
+    def test_mixed_slabs(self):
+        bill = self.engine.price([(Decimal('500'), 0, 1), (Decimal('3000'), 0, 1)])
+        self.assertIsNone(bill['gst_rate'])
+        self.assertEqual(bill['total_gst'], Decimal('25.00') + Decimal('540.00'))
+
+    def test_fee_waiver_threshold(self):
+        below = self.engine.price([(Decimal('499.99'), 0, 1)])
+        self.assertEqual(below['delivery_charge'], Decimal('50.00'))
+        self.assertEqual(below['packaging_charge'], Decimal('20.00'))
+        at = self.engine.price([(Decimal('250.00'), 0, 2)])
+        self.assertEqual(at['delivery_charge'], Decimal('0.00'))
+        self.assertEqual(at['packaging_charge'], Decimal('20.00'))
+        # grand total = subtotal + GST + the fees actually charged
+        self.assertEqual(at['grand_total'], Decimal('500.00') + at['total_gst'] + Decimal('20.00'))
+        self.assertEqual(below['grand_total'], Decimal('499.99') + below['total_gst'] + Decimal('70.00'))
+
+    def test_price_many_matches_price(self):
+        baskets = {
+            1: [(Decimal('10.05'), 50, 3), (Decimal('1200'), 0, 1)],
+            2: [(Decimal('0.10'), 0, 7)],
+        }
+        rows = [(key, *line) for key, lines in baskets.items() for line in lines]
+        bills = self.engine.price_many(rows)
+        for key, lines in baskets.items():
+            self.assertEqual(bills[key], self.engine.price(lines))
+
+    def test_price_basket_follows_settings(self):
+        with override_settings(GST_SLABS=[('0', '0.28')], ORDER_FEES=[]):
+            bill = price_basket([(Decimal('100'), 0, 1)])
+        self.assertEqual(bill['total_gst'], Decimal('28.00'))
+        self.assertEqual(bill['grand_total'], Decimal('128.00'))
+
+
+# --------------------------
+# Cart
+# --------------------------
+class CartUpsertTests(TestCase):
+    """Single-statement cart mutations keep the line and the cart totals in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('carter', 'carter@example.com', 'x')
+        category = Category.objects.create(name='Lamps')
+        cls.lamp = Product.objects.create(category=category, name='Lamp', price=Decimal('333.33'), discount=10)
+        cls.rug = Product.objects.create(category=category, name='Rug', price=Decimal('1200.00'))
+
+    def assertTotalsInStep(self):
+        """The running totals equal a recount from the cart lines"""
+        cart = Cart.objects.get(user=self.user)
+        lines = cart.items.select_related('product')
+        self.assertEqual(cart.item_count, sum(line.quantity for line in lines))
+        self.assertEqual(cart.subtotal, sum((line.line_total() for line in lines), Decimal('0')))
+        return cart
+
+    def quantity(self, product):
+        return CartItem.objects.filter(cart__user=self.user, product=product).values_list(
+            'quantity', flat=True).first()
+
+    def test_add_creates_cart_and_line(self):
+        state = add_item(self.user, self.lamp.id)
+        self.assertEqual(state, CartState(1, 1))
+        cart = self.assertTotalsInStep()
+        self.assertEqual(cart.subtotal, self.lamp.sale_price)
+
+    def test_add_existing_line_increments(self):
+        add_item(self.user, self.lamp.id)
+        state = add_item(self.user, self.lamp.id, 2)
+        self.assertEqual(state, CartState(3, 3))
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 1)
+        self.assertTotalsInStep()
+
+    def test_decrement(self):
+        add_item(self.user, self.lamp.id, 2)
+        add_item(self.user, self.rug.id)
+        self.assertEqual(decrement_item(self.user, self.lamp.id), CartState(1, 2))
+        self.assertTotalsInStep()
+        # The last unit removes the line
+        self.assertEqual(decrement_item(self.user, self.lamp.id), CartState(0, 1))
+        self.assertIsNone(self.quantity(self.lamp))
+        self.assertTotalsInStep()
+
+    def test_remove(self):
+        add_item(self.user, self.lamp.id, 3)
+        add_item(self.user, self.rug.id)
+        self.assertEqual(remove_item(self.user, self.lamp.id), CartState(0, 1))
+        cart = self.assertTotalsInStep()
+        self.assertEqual(cart.subtotal, self.rug.sale_price)
+        # Not in the cart: nothing changes
+        self.assertEqual(remove_item(self.user, self.lamp.id), CartState(None, 1))
+        self.assertTotalsInStep()
+
+    def test_unknown_product(self):
+        add_item(self.user, self.rug.id)
+        with self.assertRaises(Product.DoesNotExist):
+            add_item(self.user, 0)
+        self.assertTotalsInStep()
+        self.assertEqual(cart_count(self.user), 1)
+
+    def test_one_statement_per_table(self):
+        add_item(self.user, self.lamp.id)
+        for mutation in (add_item, decrement_item, remove_item):
+            with self.subTest(mutation=mutation.__name__), CaptureQueriesContext(connection) as queries:
+                mutation(self.user, self.lamp.id)
+            statements = [
+                query['sql'] for query in queries.captured_queries
+                if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+            ]
+            self.assertEqual(len(statements), 2, statements)
+
+    def test_orm_edits_keep_totals(self):
+        add_item(self.user, self.lamp.id)
+        line = CartItem.objects.get(cart__user=self.user, product=self.lamp)
+        line.quantity = 4
+        line.save()
+        self.assertTotalsInStep()
+        line.delete()
+        self.assertTotalsInStep()
+
+    def test_reprice_refreshes_totals(self):
+        add_item(self.user, self.lamp.id, 2)
+        self.lamp.discount = 50
+        self.lamp.save()
+        self.assertTotalsInStep()
+
+
+# --------------------------
+# Checkout
+# --------------------------
+class CheckoutTests(TestCase):
+    """A cart becomes an order with price snapshots, in one transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'x')
+        category = Category.objects.create(name='Shelves')
+        cls.products = [
+            Product.objects.create(
+                category=category, name=f'Shelf {n}', price=Decimal('999.99') + n, discount=n * 5,
+            )
+            for n in range(6)
+        ]
+
+    def fill_cart(self, user, products, quantity=2):
+        for product in products:
+            add_item(user, product.id, quantity)
+
+    def test_line_and_order_totals(self):
+        self.fill_cart(self.user, self.products[:3])
+        order = checkout_cart(self.user, payment_method='cod')
+
+        items = {item.product_id: item for item in order.items.all()}
+        self.assertEqual(set(items), {p.id for p in self.products[:3]})
+        for product in self.products[:3]:
+            item = items[product.id]
+            self.assertEqual(item.quantity, 2)
+            self.assertEqual((item.unit_price, item.discount), (product.price, product.discount))
+            self.assertEqual(item.line_total, pricing.line_total(product.price, product.discount, 2))
+        bill = price_basket((p.price, p.discount, 2) for p in self.products[:3])
+        self.assertEqual(order.total_amount, bill['grand_total'])
+        self.assertEqual(order.payment_method, 'cod')
+
+    def test_prices_are_snapshots(self):
+        self.fill_cart(self.user, self.products[:1])
+        order = checkout_cart(self.user)
+        product = self.products[0]
+        product.price = Decimal('1.00')
+        product.save()
+        item = order.items.get()
+        self.assertEqual(item.unit_price, Decimal('999.99'))
+
+    def test_order_history_uses_product_snapshot(self):
+        self.fill_cart(self.user, self.products[:2])
+        checkout_cart(self.user)
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed shelf')
+        self.client.force_login(self.user)
+        # Session, user, profile, orders, order lines: no product query
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('my_orders'))
+        self.assertContains(response, 'Shelf 0')
+        self.assertNotContains(response, 'Renamed shelf')
+
+    def test_cart_is_emptied(self):
+        self.fill_cart(self.user, self.products[:3])
+        checkout_cart(self.user)
+        cart = Cart.objects.get(user=self.user)
+        self.assertFalse(cart.items.exists())
+        self.assertEqual((cart.item_count, cart.subtotal), (0, 0))
+
+    def test_empty_cart(self):
+        with self.assertRaises(EmptyCheckout):
+            checkout_cart(self.user)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_product_creates_nothing(self):
+        with self.assertRaises(Product.DoesNotExist):
+            create_order(self.user, [(self.products[0].id, 1), (0, 1)])
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_mid_checkout_rolls_back(self):
+        # Filling an order that already has one of the lines: the order
+        # row is updated, then the item insert fails
+        order = create_order(self.user, [(self.products[0].id, 1)])
+        total = order.total_amount
+        self.fill_cart(self.user, self.products[:2])
+        with self.assertRaises(IntegrityError):
+            checkout_cart(self.user, order=order, payment_method='upi')
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.payment_method), (total, 'cod'))
+        self.assertEqual(order.items.count(), 1)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.count(), 2)
+        self.assertEqual(cart.item_count, 4)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        other = User.objects.create_user('bulk', 'bulk@example.com', 'x')
+        self.fill_cart(self.user, self.products[:1])
+        self.fill_cart(other, self.products)
+        with CaptureQueriesContext(connection) as small:
+            checkout_cart(self.user)
+        with CaptureQueriesContext(connection) as large:
+            checkout_cart(other)
+        self.assertEqual(len(small), len(large))
+        # Prices are read, and order lines written, in one statement each
+        statements = [query['sql'] for query in large.captured_queries]
+        self.assertEqual(sum(sql.startswith('SELECT "shop_product"') for sql in statements), 1)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "shop_orderitem"') for sql in statements), 1)
+
+
+# --------------------------
+# Invoices
+# --------------------------
+class InvoiceTests(TestCase):
+    """Invoices render as text and PDF, and are cached on disk per order content"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.invoice_dir = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(INVOICE_CACHE_DIR=cls.invoice_dir.name))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.invoice_dir.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('invoiced', 'invoiced@example.com', 'x', first_name='Asha')
+        category = Category.objects.create(name='Desks')
+        cls.products = [
+            Product.objects.create(category=category, name=f'Desk {n}', price=Decimal('2500.00'))
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        self.order = create_order(self.user, [(product.id, 2) for product in self.products])
+        self.client.force_login(self.user)
+
+    def download(self, fmt):
+        response = self.client.get(reverse('download_invoice', args=[self.order.id]), {'format': fmt})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def cached_files(self):
+        return sorted(path.name for path in invoices.cache_dir(self.order.id).glob('*'))
+
+    def test_text_invoice(self):
+        text = self.download('txt').decode()
+        self.assertIn(f'Order ID: #{self.order.id}', text)
+        self.assertIn('Name: Asha', text)
+        for product in self.products:
+            self.assertIn(f'{product.name}\nQuantity: 2\n', text)
+        self.assertIn(f'Total Amount: ₹{self.order.total_amount}', text)
+
+    def test_pdf_invoice(self):
+        # Enough lines for a second page
+        many = [
+            Product.objects.create(category=self.products[0].category, name=f'Lamp {n}', price=Decimal('10'))
+            for n in range(20)
+        ]
+        self.order = create_order(self.user, [(product.id, 1) for product in many])
+        pdf = self.download('pdf')
+        self.assertTrue(pdf.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        lines = list(invoices.invoice_lines(invoices.invoice_data(self.order)))
+        pages = math.ceil(len(lines) / invoices.LINES_PER_PAGE)
+        self.assertGreater(pages, 1)
+        self.assertIn(b'/Count %d' % pages, pdf)
+        self.assertIn(b'(Total Amount: Rs. %s)' % str(self.order.total_amount).encode(), pdf)
+        # The cross-reference table points at every object
+        startxref = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+        table = pdf[startxref:].split(b'\n')
+        self.assertEqual(table[0], b'xref')
+        size = int(table[1].split()[1])
+        for number, entry in enumerate(table[3:size + 2], 1):
+            offset = int(entry.split()[0])
+            self.assertTrue(pdf[offset:].startswith(b'%d 0 obj\n' % number), number)
+
+    def test_served_from_cache(self):
+        first = self.download('txt')
+        [name] = self.cached_files()
+        self.assertEqual((invoices.cache_dir(self.order.id) / name).read_bytes(), first)
+        # A cache hit is the file as stored, not a fresh rendering
+        (invoices.cache_dir(self.order.id) / name).write_bytes(b'from the cache')
+        response = self.client.get(reverse('download_invoice', args=[self.order.id]), {'format': 'txt'})
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(b''.join(response.streaming_content), b'from the cache')
+
+    def test_order_change_drops_cached_invoices(self):
+        self.download('txt')
+        self.download('pdf')
+        self.assertEqual(len(self.cached_files()), 2)
+        self.order.status = 'Shipped'
+        self.order.save()
+        self.assertEqual(self.cached_files(), [])
+        self.assertIn('Status: Shipped', self.download('txt').decode())
+
+    def test_update_changes_the_digest(self):
+        # update() skips the signals; the new content still misses the cache
+        self.download('txt')
+        [stale] = self.cached_files()
+        Order.objects.filter(pk=self.order.pk).update(status='Delivered')
+        self.assertIn('Status: Delivered', self.download('txt').decode())
+        [fresh] = self.cached_files()
+        self.assertNotEqual(fresh, stale)
+
+    def test_other_customers_order(self):
+        other = User.objects.create_user('other', 'other@example.com', 'x')
+        self.client.force_login(other)
+        response = self.client.get(reverse('download_invoice', args=[self.order.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+# --------------------------
+# Webhook inbox
+# --------------------------
+def captured(rp_order_id, payment_id='pay_1'):
+    return {'event': 'payment.captured', 'payload': {'payment': {'entity': {
+        'id': payment_id, 'order_id': rp_order_id,
+    }}}}
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='hook-secret', ORDER_EVENTS_BROKER_URL='')
+class WebhookTests(TestCase):
+    """Webhooks are stored once, then applied by the worker with retries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('payer', 'payer@example.com', 'x')
+        cls.order = Order.objects.create(customer=user.profile, user=user, payment_method='online')
+        cls.payment = Payment.objects.create(order=cls.order, razorpay_order_id='order_hook', amount=1)
+
+    def post(self, body, event_id=None):
+        headers = {'X-Razorpay-Signature': signatures.sign(body, 'hook-secret')}
+        if event_id is not None:
+            headers['X-Razorpay-Event-Id'] = event_id
+        return self.client.post(
+            reverse('razorpay_webhook'), body, content_type='application/json', headers=headers,
+        )
+
+    def stored(self, event, event_id):
+        return WebhookEvent.objects.create(event_id=event_id, event=event['event'], payload=json.dumps(event))
+
+    def test_duplicate_event_id_ignored(self):
+        body = json.dumps(captured('order_hook')).encode()
+        self.assertEqual(self.post(body, 'evt_1').status_code, 200)
+        self.assertEqual(self.post(body, 'evt_1').status_code, 200)
+        self.assertEqual(WebhookEvent.objects.filter(event_id='evt_1').count(), 1)
+        # Without the header the body digest is the id
+        self.post(body)
+        self.post(body)
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+
+    def test_overlong_event_id_rejected(self):
+        body = json.dumps(captured('order_hook')).encode()
+        response = self.post(body, 'e' * (webhooks.EVENT_ID_MAX_LENGTH + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post(body, 'e' * webhooks.EVENT_ID_MAX_LENGTH).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_body_must_be_utf8(self):
+        for body in ('{"event": "payment.captured"}'.encode('utf-16'), b'{"event": "caf\xe9"}'):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body, 'evt_bad').status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_applies_payment_captured(self):
+        self.stored(captured('order_hook'), 'evt_1')
+        self.assertEqual(webhooks.process_batch(), 1)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.order.payment_status), ('paid', 'Paid'))
+        self.assertIsNotNone(WebhookEvent.objects.get().processed_at)
+        # Nothing left to do
+        self.assertEqual(webhooks.process_batch(), 0)
+
+    def test_failing_event_retried_up_to_max_attempts(self):
+        broken = WebhookEvent.objects.create(event_id='evt_broken', event='payment.captured', payload='{}')
+        for attempt in range(1, webhooks.MAX_ATTEMPTS + 1):
+            webhooks.process_batch()
+            broken.refresh_from_db()
+            self.assertEqual(broken.attempts, attempt)
+            self.assertIn('KeyError', broken.error)
+            # Left pending until the last attempt, then parked for inspection
+            self.assertEqual(broken.processed_at is not None, attempt == webhooks.MAX_ATTEMPTS)
+        webhooks.process_batch()
+        broken.refresh_from_db()
+        self.assertEqual(broken.attempts, webhooks.MAX_ATTEMPTS)
+
+    def test_failing_event_does_not_block_the_batch(self):
+        WebhookEvent.objects.create(event_id='evt_broken', event='payment.captured', payload='{}')
+        self.stored(captured('order_hook'), 'evt_good')
+        self.assertEqual(webhooks.process_batch(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'paid')
+        self.assertIsNotNone(WebhookEvent.objects.get(event_id='evt_good').processed_at)
+        self.assertIsNone(WebhookEvent.objects.get(event_id='evt_broken').processed_at)
+
+    def test_drain_continues_past_a_failing_event(self):
+        WebhookEvent.objects.create(event_id='evt_broken', event='payment.captured', payload='{}')
+        for n in range(4):
+            WebhookEvent.objects.create(event_id=f'evt_{n}', event='order.paid', payload='{}')
+        webhooks.drain(batch_size=3)
+        pending = WebhookEvent.objects.filter(processed_at__isnull=True)
+        self.assertEqual(list(pending.values_list('event_id', flat=True)), ['evt_broken'])
+
+    def test_payment_captured_saves_the_order(self):
+        saved = []
+
+        def receiver(sender, instance, **kwargs):
+            saved.append((instance.pk, instance.payment_status))
+
+        post_save.connect(receiver, sender=Order)
+        self.addCleanup(post_save.disconnect, receiver, sender=Order)
+        self.stored(captured('order_hook'), 'evt_1')
+        webhooks.process_batch()
+        # Through Order.save(), so its receivers (status events, push) run
+        self.assertEqual(saved, [(self.order.pk, 'Paid')])
+
+
+# --------------------------
+# Order update streams
+# --------------------------
+@override_settings(ORDER_EVENTS_BROKER_URL='')
+class PushTests(TestCase):
+    """Order changes reach the customer's open streams in this process"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('watcher', 'watcher@example.com', 'x')
+        # No user on the order, only the customer
+        cls.order = Order.objects.create(customer=cls.user.profile)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, hub, customer_id):
+        async def subscribe():
+            return hub.subscribe(customer_id)
+
+        subscription = self.loop.run_until_complete(subscribe())
+        self.addCleanup(hub.unsubscribe, customer_id, subscription)
+        return subscription
+
+    def received(self, subscription):
+        # Run the puts deliver() scheduled on the stream's loop
+        self.loop.run_until_complete(asyncio.sleep(0))
+        messages = []
+        while not subscription.queue.empty():
+            messages.append(subscription.queue.get_nowait())
+        return messages
+
+    def test_hub_delivers_to_the_customers_streams(self):
+        hub = push.Hub()
+        first, second, other = self.subscribe(hub, 1), self.subscribe(hub, 1), self.subscribe(hub, 2)
+        hub.deliver(1, {'n': 1})
+        self.assertEqual(self.received(first), [{'n': 1}])
+        self.assertEqual(self.received(second), [{'n': 1}])
+        self.assertEqual(self.received(other), [])
+
+        hub.unsubscribe(1, first)
+        self.assertEqual(hub.connection_count(), 2)
+        hub.deliver(1, {'n': 2})
+        self.assertEqual(self.received(first), [])
+        self.assertEqual(self.received(second), [{'n': 2}])
+
+    def test_order_save_publishes_on_commit(self):
+        subscription = self.subscribe(push.hub, self.order.customer_id)
+        order = Order.objects.get(pk=self.order.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                order.status = Order.STATUS_SHIPPED
+                order.save()
+            self.assertEqual(self.received(subscription), [])
+        self.assertEqual(
+            self.received(subscription), [push.order_message(order.pk, Order.STATUS_SHIPPED, 'Pending')],
+        )
+        # The customer id is on the order: no profile or user lookup
+        self.assertFalse([q['sql'] for q in queries if 'shop_profile' in q['sql'] or 'auth_user' in q['sql']])
+
+    def test_event_stream(self):
+        async def read():
+            stream = push.event_stream(7)
+            first = await anext(stream)
+            push.hub.deliver(7, {'order_id': 1})
+            second = await anext(stream)
+            await stream.aclose()
+            return first, second
+
+        with override_settings(ORDER_EVENTS_RETRY_MS=2000):
+            first, second = self.loop.run_until_complete(read())
+        self.assertEqual(first, "retry: 2000\n\n")
+        self.assertEqual(second, 'event: order\ndata: {"order_id": 1}\n\n')
+        self.assertEqual(push.hub.connection_count(), 0)
+
+    def test_wsgi_request_gets_204(self):
+        url = reverse('order_events')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.user)
+        # EventSource does not reconnect after a 204
+        self.assertEqual(self.client.get(url).status_code, 204)
+
+
+# --------------------------
+# Payment gateway client
+# --------------------------
+ORDER = {'amount': 50000, 'currency': 'INR'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class GatewayClientTests(SimpleTestCase):
+    """Retries, backoff, circuit breaker and pooling of AsyncGateway, against FakeGateway"""
+
+    def setUp(self):
+        self.fake = FakeGateway().start()
+        self.addCleanup(self.fake.stop)
+
+    def call(self, *requests, breaker=None, **options):
+        """Run `requests` (coroutine functions taking the client) on one fresh client"""
+        options = {'max_retries': 2, 'backoff': 0.01, **options}
+
+        async def run():
+            client = gateway.AsyncGateway('rzp_test', 'secret', self.fake.url, breaker=breaker, **options)
+            try:
+                return [await request(client) for request in requests]
+            finally:
+                await client.aclose()
+
+        return asyncio.run(run())
+
+    def create(self, client):
+        return client.request('POST', '/v1/orders', json=ORDER)
+
+    def test_retries_server_errors(self):
+        self.fake.fail_next(2, status=503)
+        [order] = self.call(self.create)
+        self.assertEqual(order['amount'], ORDER['amount'])
+        self.assertEqual(self.fake.requests, 3)
+
+    def test_gives_up_after_max_retries_with_bounded_backoff(self):
+        self.fake.fail_next(3, status=502)
+        start = time.perf_counter()
+        with self.assertRaises(razorpay.errors.ServerError):
+            self.call(self.create, backoff=0.05)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(self.fake.requests, 3)
+        # Two waits: 0.05 s and 0.1 s, each jittered by +-25%
+        self.assertGreaterEqual(elapsed, 0.75 * 0.15)
+        self.assertLess(elapsed, 1.25 * 0.15 + 1.0)
+
+    def test_retries_timeouts(self):
+        self.fake.delay = 0.3
+        with self.assertRaises(httpx.TimeoutException):
+            self.call(self.create, max_retries=1, timeout=(1, 0.05))
+        # A timed-out connection is not reused: one connection per attempt
+        self.assertEqual(self.fake.connections, 2)
+
+    def test_client_errors_are_not_retried(self):
+        breaker = gateway.CircuitBreaker(threshold=1)
+        with self.assertRaises(razorpay.errors.BadRequestError):
+            self.call(lambda client: client.request('POST', '/v1/orders', json={'amount': 1}), breaker=breaker)
+        self.assertEqual(self.fake.requests, 1)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_breaker_opens_then_half_opens(self):
+        clock = FakeClock()
+        breaker = gateway.CircuitBreaker(threshold=2, reset_timeout=30, clock=clock)
+        self.fake.fail_next(2)
+        for _ in range(2):
+            with self.assertRaises(razorpay.errors.ServerError):
+                self.call(self.create, breaker=breaker, max_retries=0)
+        self.assertEqual(breaker.state, 'open')
+
+        # Open: fails fast without reaching the gateway
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.call(self.create, breaker=breaker)
+        self.assertEqual(self.fake.requests, 2)
+
+        # Half-open: one trial call; a failure opens the breaker again
+        clock.now += 30
+        self.assertEqual(breaker.state, 'half-open')
+        self.fake.fail_next(1)
+        with self.assertRaises(razorpay.errors.ServerError):
+            self.call(self.create, breaker=breaker, max_retries=0)
+        self.assertEqual(breaker.state, 'open')
+
+        # A successful trial closes it
+        clock.now += 30
+        self.call(self.create, breaker=breaker)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_half_open_lets_one_trial_through(self):
+        clock = FakeClock()
+        breaker = gateway.CircuitBreaker(threshold=1, reset_timeout=30, clock=clock)
+        self.fake.fail_next(1)
+        with self.assertRaises(razorpay.errors.ServerError):
+            self.call(self.create, breaker=breaker, max_retries=0)
+        clock.now += 30
+        self.fake.delay = 0.2
+
+        async def both(client):
+            return await asyncio.gather(self.create(client), self.create(client), return_exceptions=True)
+
+        [results] = self.call(both, breaker=breaker)
+        self.assertEqual(sum(isinstance(r, gateway.GatewayUnavailable) for r in results), 1)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_cancelled_trial_frees_half_open_breaker(self):
+        clock = FakeClock()
+        breaker = gateway.CircuitBreaker(threshold=1, reset_timeout=30, clock=clock)
+        self.fake.fail_next(1)
+        with self.assertRaises(razorpay.errors.ServerError):
+            self.call(self.create, breaker=breaker, max_retries=0)
+        clock.now += 30
+        self.fake.delay = 0.5
+
+        async def cancelled(client):
+            trial = asyncio.ensure_future(self.create(client))
+            await asyncio.sleep(0.05)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+        self.call(cancelled, breaker=breaker)
+        self.assertEqual(breaker.state, 'half-open')
+        self.fake.delay = 0
+        self.call(self.create, breaker=breaker)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_unexpected_error_settles_half_open_trial(self):
+        clock = FakeClock()
+        breaker = gateway.CircuitBreaker(threshold=1, reset_timeout=30, clock=clock)
+        self.fake.fail_next(1)
+        with self.assertRaises(razorpay.errors.ServerError):
+            self.call(self.create, breaker=breaker, max_retries=0)
+        clock.now += 30
+        # The body cannot be encoded: fails before any request is sent
+        with self.assertRaises(TypeError):
+            self.call(lambda client: client.request('POST', '/v1/orders', json={'notes': object()}), breaker=breaker)
+        self.assertEqual(breaker.state, 'open')
+        clock.now += 30
+        self.call(self.create, breaker=breaker)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_reuses_connections(self):
+        self.call(*[self.create] * 5)
+        self.assertEqual(self.fake.requests, 5)
+        self.assertEqual(self.fake.connections, 1)
+
+    def test_process_client_shared_across_event_loops(self):
+        # Each async view under WSGI runs on a loop of its own
+        with override_settings(RAZORPAY_KEY_ID='rzp_test', RAZORPAY_KEY_SECRET='secret',
+                               RAZORPAY_BASE_URL=self.fake.url):
+            for _ in range(3):
+                asyncio.run(gateway.acreate_order(ORDER))
+        self.assertEqual(self.fake.requests, 3)
+        self.assertEqual(self.fake.connections, 1)
+
+
+# --------------------------
+# Signatures
+# --------------------------
+def sdk_verifies(check, *args):
+    """The SDK's answer as a bool: it raises on a bad (or unreadable) signature"""
+    try:
+        return bool(check(*args))
+    except (razorpay.errors.SignatureVerificationError, TypeError):
+        return False
+
+
+class SignatureTests(SimpleTestCase):
+    """Local signature checks give the same answer as the Razorpay SDK"""
+
+    secret = 'test-secret'
+    body = b'{"event": "payment.captured", "payload": {"amount": 100}}'
+
+    def signatures_to_try(self, valid):
+        return {
+            'valid': valid,
+            'tampered': valid[:-1] + ('0' if valid[-1] != '0' else '1'),
+            'empty': '',
+            'non-ascii': valid[:-1] + '\u00e9',
+            'all non-ascii': '\u0928\u092e\u0938\u094d\u0924\u0947',
+        }
+
+    def test_payment_signature(self):
+        utility = razorpay.Utility(razorpay.Client(auth=('rzp_test', self.secret)))
+        valid = signatures.sign('order_1|pay_1', self.secret)
+        for case, signature in self.signatures_to_try(valid).items():
+            with self.subTest(case=case):
+                expected = sdk_verifies(utility.verify_payment_signature, {
+                    'razorpay_order_id': 'order_1',
+                    'razorpay_payment_id': 'pay_1',
+                    'razorpay_signature': signature,
+                })
+                self.assertIs(
+                    signatures.verify_payment_signature('order_1', 'pay_1', signature, self.secret), expected,
+                )
+                self.assertIs(expected, case == 'valid')
+
+    def test_webhook_signature(self):
+        utility = razorpay.Utility()
+        valid = signatures.sign(self.body, self.secret)
+        for case, signature in self.signatures_to_try(valid).items():
+            with self.subTest(case=case):
+                expected = sdk_verifies(
+                    utility.verify_webhook_signature, self.body.decode(), signature, self.secret,
+                )
+                self.assertIs(signatures.verify_webhook_signature(self.body, signature, self.secret), expected)
+                self.assertIs(expected, case == 'valid')
+
+    def test_missing_secret(self):
+        valid = signatures.sign(self.body, self.secret)
+        self.assertFalse(signatures.verify_webhook_signature(self.body, valid, ''))
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test', RAZORPAY_KEY_SECRET='key-secret', RAZORPAY_WEBHOOK_SECRET='hook-secret')
+class SignatureViewTests(TestCase):
+    """A signature the server cannot even compare is rejected, not a server error"""
+
+    def test_payment_verify_non_ascii_signature(self):
+        response = self.client.post(reverse('payment_verify'), {
+            'razorpay_order_id': 'order_1',
+            'razorpay_payment_id': 'pay_1',
+            'razorpay_signature': '\u00e9' * 64,
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_webhook_non_ascii_signature(self):
+        response = self.client.post(
+            reverse('razorpay_webhook'), b'{"event": "payment.captured"}', content_type='application/json',
+            headers={'X-Razorpay-Signature': '\u00e9' * 64},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# --------------------------
+# Database connections
+# --------------------------
+def sqlite_file_connection(path, alias='default'):
+    """A new connection with `alias`'s settings, on the SQLite file at `path`"""
+    settings_dict = {**connections[alias].settings_dict, 'NAME': path}
+    return connections[alias].__class__(settings_dict, alias)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Checks SQLite pragmas")
+class SQLiteConnectionTests(SimpleTestCase):
+    """Every connection is tuned by the pragmas in settings; WAL is set once per file"""
+
+    # Opens its own connections, on a scratch file
+    databases = {'default'}
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'shop.sqlite3')
+
+    def connect(self):
+        wrapper = sqlite_file_connection(self.path)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_on_connect(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
+        self.assertEqual(self.pragma(wrapper, 'mmap_size'), settings.SQLITE_PRAGMAS['mmap_size'])
+        timeout = connection.settings_dict['OPTIONS']['timeout']
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), timeout * 1000)
+
+    def test_transactions_begin_immediate(self):
+        # Write transactions take the lock at BEGIN, not at their first write
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Category.objects.exists()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_journal_mode_set_once_by_migration(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        migration = import_module('shop.migrations.0020_sqlite_journal_mode')
+        with wrapper.schema_editor(atomic=False) as editor:
+            migration.set_journal_mode(None, editor)
+        wrapper.close()
+        # Stored in the file: a new connection is already in WAL mode
+        self.assertEqual(self.pragma(self.connect(), 'journal_mode'), settings.SQLITE_JOURNAL_MODE.lower())
+
+
+class DBMetricsTests(TestCase):
+    """Connection metrics per database, with no pool section outside Postgres pooling"""
+
+    def test_snapshot_without_a_pool(self):
+        before = dbmetrics.snapshot()
+        self.assertEqual(before['pid'], os.getpid())
+        self.assertEqual(set(before['databases']), set(connections))
+        default = before['databases']['default']
+        # At least the test database's own connection
+        self.assertGreaterEqual(default['connections_opened'], 1)
+        self.assertEqual(default, {
+            'vendor': connection.vendor,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'connections_opened': default['connections_opened'],
+            'pool': None,
+        })
+        # Every new connection is counted under its alias
+        with tempfile.TemporaryDirectory() as folder:
+            wrapper = sqlite_file_connection(os.path.join(folder, 'metrics.sqlite3'))
+            wrapper.ensure_connection()
+            wrapper.close()
+        after = dbmetrics.snapshot()['databases']['default']['connections_opened']
+        self.assertEqual(after, default['connections_opened'] + 1)
+
+    def test_staff_only(self):
+        response = self.client.get(reverse('db_metrics'))
+        self.assertEqual(response.status_code, 302)
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('db_metrics'))
+        self.assertEqual(response.json()['databases']['default']['pool'], None)
+
+
+# --------------------------
+# Query and render-time budgets
+# --------------------------
+QUERY_BUDGETS = Path(__file__).with_name('query_budgets.json')
+
+# Who makes the request: nobody, a new account, a shopper with a cart and a
+# wishlist, and a returning customer with all of that plus a page of orders
+SCENARIOS = ('anonymous', 'user', 'cart', 'orders')
+
+# URL namespaces not walked: the Django admin is Django's own code
+SKIPPED_NAMESPACES = {'admin'}
+
+WEBHOOK_BODY = json.dumps({'event': 'payment.captured', 'payload': {}}).encode()
+
+
+def _webhook(f):
+    return {
+        'method': 'post', 'data': WEBHOOK_BODY, 'content_type': 'application/json',
+        'headers': {'X-Razorpay-Signature': signatures.sign(WEBHOOK_BODY, 'budget-webhook-secret')},
+    }
+
+
+def _payment_verify(f):
+    rp_order_id, rp_payment_id = f.payment.razorpay_order_id, 'pay_budget'
+    return {'method': 'post', 'data': {
+        'razorpay_order_id': rp_order_id,
+        'razorpay_payment_id': rp_payment_id,
+        'razorpay_signature': signatures.sign(f"{rp_order_id}|{rp_payment_id}", 'budget-key-secret'),
+    }}
+
+
+# How to call routes that need URL arguments or more than a plain GET. The
+# product and order belong to the fixtures' cart and orders users, so other
+# scenarios exercise the not-found and not-yours paths.
+ROUTE_REQUESTS = {
+    'search_products': lambda f: {'query': {'q': 'oak'}},
+    'search_suggest': lambda f: {'query': {'q': 'oa'}},
+    'products_by_category': lambda f: {'kwargs': {'category_slug': f.category.slug}},
+    'product_detail': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'buy_now': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'add_to_cart': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'increment_cart_item': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'decrement_cart_item': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'remove_from_cart': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'toggle_wishlist': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'wishlist_toggle': lambda f: {'kwargs': {'product_id': f.product.id}},
+    'track_order': lambda f: {'query': {'order_id': f.order.id}},
+    'order_status_api': lambda f: {'kwargs': {'order_id': f.order.id}},
+    'order_success': lambda f: {'kwargs': {'order_id': f.order.id}},
+    'pay_now': lambda f: {'kwargs': {'order_id': f.order.id}},
+    'cancel_order': lambda f: {'kwargs': {'order_id': f.order.id}, 'method': 'post'},
+    'download_invoice': lambda f: {'kwargs': {'order_id': f.order.id}},
+    'payment_create': lambda f: {'kwargs': {'order_id': f.order.id}},
+    'payment_verify': _payment_verify,
+    'razorpay_webhook': _webhook,
+    'password_reset_confirm': lambda f: {'kwargs': {'uidb64': 'MQ', 'token': 'set-password'}},
+    # These three have no template to GET (accounts/admin_*.html and the
+    # buy page's pricing context are missing); their form posts redirect
+    'admin_login': lambda f: {'method': 'post', 'data': {'username': 'staff', 'password': 'x'}},
+    'admin_register': lambda f: {'method': 'post', 'data': {
+        'username': 'new-admin', 'email': 'new-admin@example.com',
+        'password1': 'Budget-pass-9271', 'password2': 'Budget-pass-9271',
+    }},
+    'buy': lambda f: {'method': 'post', 'data': {
+        'name': 'Budget Buyer', 'phone': '9999999999', 'address': '1 Budget Street', 'payment_method': 'cod',
+    }},
+}
+
+
+def named_routes(patterns=None, namespace=None):
+    """Names of every route in the URLconf, each once (shop.urls is mounted twice)"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    names = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace in SKIPPED_NAMESPACES:
+                continue
+            inner = f'{namespace}:{pattern.namespace}' if namespace and pattern.namespace else (
+                pattern.namespace or namespace
+            )
+            names.extend(named_routes(pattern.url_patterns, inner))
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.append(f'{namespace}:{pattern.name}' if namespace else pattern.name)
+    return list(dict.fromkeys(names))
+
+
+def time_budget(elapsed_ms):
+    """A render-time budget with headroom for slower machines: 4x, in 50 ms steps"""
+    return max(200, math.ceil(elapsed_ms * 4 / 50) * 50)
+
+
+@override_settings(
+    RAZORPAY_KEY_ID='rzp_test_budget',
+    RAZORPAY_KEY_SECRET='budget-key-secret',
+    RAZORPAY_WEBHOOK_SECRET='budget-webhook-secret',
+    RAZORPAY_MAX_RETRIES=0,
+    ORDER_EVENTS_BROKER_URL='',
+    # Password hashing would dominate the admin_login and admin_register times
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(TestCase):
+    """
+    Every route, called as each scenario, stays within the number of queries
+    declared in shop/query_budgets.json.
+
+    Caches are cleared before each request, so the counts are for a cold
+    cache. After a deliberate change, regenerate the file with
+    QUERY_BUDGETS_UPDATE=1 python manage.py test shop.tests.QueryBudgetTests
+    and review the diff; routes already in the file keep their time budget.
+
+    The time budgets already allow 4x the recorded render time; shared CI
+    runners (CI set in the environment) get another 3x on top.
+    QUERY_BUDGET_TIME_FACTOR overrides that multiplier.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gateway = FakeGateway().start()
+        cls.invoice_dir = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(
+            RAZORPAY_BASE_URL=cls.gateway.url, INVOICE_CACHE_DIR=cls.invoice_dir.name,
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.gateway.stop()
+        cls.invoice_dir.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=name) for name in ('Sofas', 'Beds', 'Tables')]
+        products = [
+            Product.objects.create(
+                category=categories[n % 3], name=f'Oak piece {n}', price=Decimal(1000 + 100 * n),
+                discount=(n * 5) % 40, rating=Decimal('4.5'), description='Solid oak',
+                image=f'products/oak-{n}.jpg',
+            )
+            for n in range(30)
+        ]
+        cls.category, cls.product = categories[0], products[0]
+
+        cls.users = {'anonymous': None}
+        for scenario in SCENARIOS[1:]:
+            cls.users[scenario] = User.objects.create_user(scenario, f'{scenario}@example.com', 'x')
+        # Logs in through admin_login
+        User.objects.create_user('staff', 'staff@example.com', 'x', is_staff=True)
+        for scenario in ('cart', 'orders'):
+            user = cls.users[scenario]
+            for product in products[:5]:
+                add_item(user, product.id)
+                WishlistItem.objects.create(user=user, product=product)
+
+        # More orders than fit on one My Orders page, three lines each
+        customer = cls.users['orders']
+        for n in range(12):
+            order = create_order(customer, [(p.id, 1 + n % 2) for p in products[n:n + 3]],
+                                 shipping_address='1 Budget Street', payment_method='online')
+            if n % 3 == 1:
+                order.status = Order.STATUS_SHIPPED
+                order.save()
+        cls.order = order
+        cls.payment = Payment.objects.create(order=order, razorpay_order_id='order_budget', amount=1)
+
+    def request(self, name, scenario):
+        spec = {'method': 'get', 'kwargs': {}, 'query': None}
+        spec.update(ROUTE_REQUESTS.get(name, lambda f: {})(self))
+        url = reverse(name, kwargs=spec.pop('kwargs'))
+        client = self.client_class()
+        if self.users[scenario] is not None:
+            client.force_login(self.users[scenario])
+        method = getattr(client, spec.pop('method'))
+        query = spec.pop('query')
+        if query:
+            spec['query_params'] = query
+
+        for backend in caches.all():
+            backend.clear()
+        with transaction.atomic(), ExitStack() as stack:
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            start = time.perf_counter()
+            response = method(url, **spec)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+            response.close()
+            # Leave the fixtures as they were for the next request
+            transaction.set_rollback(True)
+        queries = [query['sql'] for capture in captures for query in capture.captured_queries]
+        return response, queries, elapsed
+
+    def test_routes_within_budget(self):
+        routes = named_routes()
+        budgets = json.loads(QUERY_BUDGETS.read_text()) if QUERY_BUDGETS.exists() else {}
+        factor = float(os.environ.get('QUERY_BUDGET_TIME_FACTOR', 3 if os.environ.get('CI') else 1))
+        updating = bool(os.environ.get('QUERY_BUDGETS_UPDATE'))
+
+        recorded = {}
+        for name in routes:
+            counts, slowest = {}, 0
+            for scenario in SCENARIOS:
+                with self.subTest(route=name, scenario=scenario):
+                    response, queries, elapsed = self.request(name, scenario)
+                    self.assertLess(response.status_code, 500, f"{name} failed for {scenario}")
+                    counts[scenario] = len(queries)
+                    slowest = max(slowest, elapsed)
+                    if updating:
+                        continue
+                    self.assertIn(name, budgets, f"No budget for route {name!r} in {QUERY_BUDGETS.name}")
+                    budget = budgets[name]
+                    self.assertLessEqual(
+                        len(queries), budget['queries'][scenario],
+                        f"{name} ({scenario}) ran {len(queries)} queries, budget "
+                        f"{budget['queries'][scenario]}:\n" + '\n'.join(queries),
+                    )
+                    self.assertLessEqual(
+                        elapsed, budget['ms'] * factor,
+                        f"{name} ({scenario}) took {elapsed:.0f} ms, budget {budget['ms'] * factor:.0f} ms",
+                    )
+            ms = budgets[name]['ms'] if name in budgets else time_budget(slowest)
+            recorded[name] = {'ms': ms, 'queries': counts}
+
+        if updating:
+            QUERY_BUDGETS.write_text(json.dumps(recorded, indent=2, sort_keys=True) + '\n')
+        else:
+            self.assertEqual(
+                sorted(set(budgets) - set(routes)), [],
+                f"{QUERY_BUDGETS.name} has budgets for routes that no longer exist",
+            )
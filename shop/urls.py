@@ -8,6 +8,7 @@ urlpatterns = [
     # -------------------
     path("", views.home, name="home"),
     path("search/", views.search_products, name="search_products"),
+    path("search/suggest/", views.search_suggest, name="search_suggest"),
     path("signup/", views.signup, name="signup"),
     path("login/", views.login_view, name="login"),
     path("logout/", views.logout_view, name="logout"),
@@ -24,6 +25,9 @@ urlpatterns = [
     path("support/", views.support_page, name="support"),
     path("returns/", views.returns_page, name="returns"),
     path("track-order/", views.track_order_page, name="track_order"),
+    path("api/order-status/<int:order_id>/", views.get_order_status_api, name="order_status_api"),
+    path("api/order-events/", views.order_events, name="order_events"),
+    path("metrics/db/", views.db_metrics, name="db_metrics"),
     path("offers/", views.offers_page, name="offers"),
     path("about/", views.about, name="about"),
     path("contact/", views.contact, name="contact"),
@@ -34,8 +38,11 @@ urlpatterns = [
     path("order/invoice/<int:order_id>/", views.download_invoice, name="download_invoice"),
     path("payment/create/<int:order_id>/", views.payment_create, name="payment_create"),
     path("payment/verify/", views.payment_verify, name="payment_verify"),
+    path("payment/webhook/", views.razorpay_webhook, name="razorpay_webhook"),
     path("products/buy/<int:product_id>/", views.buy_now, name="buy_now"),  # legacy: redirect to buy
     path("cart/add/<int:product_id>/", views.add_to_cart, name="add_to_cart"),
+    path("cart/increment/<int:product_id>/", views.increment_cart_item, name="increment_cart_item"),
+    path("cart/decrement/<int:product_id>/", views.decrement_cart_item, name="decrement_cart_item"),
     path("cart/remove/<int:product_id>/", views.remove_from_cart, name="remove_from_cart"),
     path("wishlist/toggle/<int:product_id>/", views.toggle_wishlist, name="toggle_wishlist"),
     path("wishlist-toggle/<int:product_id>/", views.wishlist_toggle, name="wishlist_toggle"),
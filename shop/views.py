@@ -1,73 +1,91 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import FileResponse, HttpResponse, JsonResponse, Http404, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
-from decimal import Decimal
+from django.db.models import Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 import json
 
-from .models import Product, Profile, Category, WishlistItem, Cart, CartItem, Order, OrderItem, Payment
+from .models import Product, Profile, Category, WishlistItem, Cart, Order, Payment
+from . import catalog, dbmetrics, gateway, invoices, push, search, signatures, suggest, tracking, webhooks
+from .cart import aadd_item, adecrement_item, aremove_item
+from .checkout import EmptyCheckout, checkout_cart, create_order
+from .pricing import price_basket
+from .pagination import keyset_page
 from django.conf import settings
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 import razorpay
 
 # --------------------------
 # Home page
 # --------------------------
+@ensure_csrf_cookie
 def home(request):
-    categories = Category.objects.all()
-    cart = request.session.get('cart', {})
-    cart_count = sum(cart.values()) if isinstance(cart, dict) else 0
-    wishlist_ids = set()
+    categories = catalog.home_categories()
+    wishlist_ids = []
     if request.user.is_authenticated:
-        wishlist_ids = set(WishlistItem.objects.filter(user=request.user).values_list('product_id', flat=True))
+        wishlist_ids = list(WishlistItem.objects.filter(user=request.user).values_list('product_id', flat=True))
+    # Category sections are cached for everyone, so wishlist hearts are
+    # highlighted client-side from this list instead of inside the fragment.
     return render(request, 'shop/index.html', {
         'categories': categories,
-        'cart_count': cart_count,
         'wishlist_ids': wishlist_ids,
+        'catalog_version': catalog.catalog_version(),
+        'catalog_cache_timeout': settings.CATALOG_CACHE_TIMEOUT,
     })
 
 # --------------------------
 # Search products
 # --------------------------
+@ensure_csrf_cookie
 def search_products(request):
     query = request.GET.get('q', '').strip()
     categories = Category.objects.all()
-    cart = request.session.get('cart', {})
-    cart_count = sum(cart.values()) if isinstance(cart, dict) else 0
     wishlist_ids = set()
     if request.user.is_authenticated:
         wishlist_ids = set(WishlistItem.objects.filter(user=request.user).values_list('product_id', flat=True))
     
     search_results = []
     if query:
-        # Search in product name, description, and category name
-        search_results = Product.objects.filter(
-            name__icontains=query
-        ) | Product.objects.filter(
-            description__icontains=query
-        ) | Product.objects.filter(
-            category__name__icontains=query
-        )
-        search_results = search_results.distinct()
-    
+        # Ranked match over product name, description and category name
+        search_results = search.search_products(query)
+
     return render(request, 'shop/search_results.html', {
         'categories': categories,
-        'cart_count': cart_count,
         'wishlist_ids': wishlist_ids,
         'query': query,
         'search_results': search_results,
     })
 
+# --------------------------
+# Search-as-you-type suggestions
+# --------------------------
+def search_suggest(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JsonResponse({
+        'query': query,
+        'suggestions': suggest.suggest(query, limit) if query else [],
+    })
+
 # --------------------------
 # All Products page
 # --------------------------
+@ensure_csrf_cookie
 def all_products(request):
-    return redirect('home')
+    return _product_listing(request)
 
 # --------------------------
 # Categories page
@@ -79,8 +97,35 @@ def categories(request):
 # --------------------------
 # Products filtered by category
 # --------------------------
+@ensure_csrf_cookie
 def products_by_category(request, category_slug):
-    return redirect('home')
+    category = get_object_or_404(Category, slug=category_slug)
+    return _product_listing(request, category)
+
+def _product_listing(request, category=None):
+    filters = catalog.parse_listing_filters(request.GET)
+    products, next_cursor = catalog.product_listing(
+        category=category,
+        filters=filters,
+        cursor=request.GET.get('cursor'),
+        page_size=settings.PRODUCTS_PER_PAGE,
+    )
+    wishlist_ids = set()
+    if request.user.is_authenticated:
+        wishlist_ids = set(WishlistItem.objects.filter(user=request.user).values_list('product_id', flat=True))
+
+    # Keep the active filters on the "next page" link
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return render(request, 'shop/product_list.html', {
+        'categories': Category.objects.all(),
+        'current_category': category,
+        'products': products,
+        'filters': filters,
+        'filter_query': params.urlencode(),
+        'next_cursor': next_cursor,
+        'wishlist_ids': wishlist_ids,
+    })
 
 # --------------------------
 # Profile page
@@ -230,8 +275,17 @@ def buy_form(request):
         payment_method = (request.POST.get('payment_method') or 'cod')
         profile = getattr(request.user, 'profile', None)
         if profile:
-            order = Order.objects.create(customer=profile)
-            if payment_method == 'upi':
+            try:
+                order = checkout_cart(
+                    request.user,
+                    shipping_address=address,
+                    payment_method=payment_method,
+                    payment_status='Pending',
+                )
+            except EmptyCheckout:
+                messages.error(request, "Your cart is empty.")
+                return redirect('cart')
+            if payment_method in ['upi', 'card']:
                 return redirect('pay_now', order_id=order.id)
             messages.success(request, "Order placed successfully.")
             return redirect('order_success', order_id=order.id)
@@ -261,63 +315,79 @@ def returns_page(request):
     return render(request, 'shop/returns.html')
 
 def track_order_page(request):
-    order_id = request.GET.get('order_id')
-    order = None
-    if order_id and request.user.is_authenticated:
-        order = get_object_or_404(Order, id=order_id, user=request.user)
-    
-    return render(request, 'shop/track_order.html', {'order': order})
+    # Only the page shell: the timeline is loaded (and polled) from
+    # get_order_status_api, which checks the order belongs to the user
+    order_id = request.GET.get('order_id', '')
+    return render(request, 'shop/track_order.html', {
+        'order_id': order_id if order_id.isdigit() else None,
+    })
 
 def get_order_status_api(request, order_id):
     """
-    Mock API to return order tracking details.
-    In a real app, this would fetch from a shipping provider's API.
+    Tracking timeline of one of the user's orders, as JSON.
+
+    Served from the tracking cache with ETag and Last-Modified validators:
+    a poll that sends them back gets a 304 until the order's status changes.
     """
-    try:
-        # Security Fix: Ensure the order belongs to the logged-in user.
-        if not request.user.is_authenticated:
-            return JsonResponse({"error": "Authentication required"}, status=401)
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
 
-        # Use user=request.user to scope the query
-        order = get_object_or_404(Order, id=order_id, user=request.user)
-        
-        # Mock different timelines based on order status
-        if order.status == Order.STATUS_DELIVERED:
-            timeline = [
-               {"status": "Order Placed", "time": "2025-11-02 10:00 AM", "details": "Your order has been placed."},
-               {"status": "Packed", "time": "2025-11-02 12:30 PM", "details": "Your order has been packed."},
-               {"status": "Shipped", "time": "2025-11-03 08:00 AM", "details": "Your order has been shipped."},
-               {"status": "Out for Delivery", "time": "2025-11-04 09:00 AM", "details": "Your order is out for delivery."},
-               {"status": "Delivered", "time": "2025-11-04 05:00 PM", "details": "Your order has been delivered."}
-            ]
-            current_status = "Delivered"
-        elif order.status == Order.STATUS_SHIPPED:
-            timeline = [
-               {"status": "Order Placed", "time": "2025-11-02 10:00 AM", "details": "Your order has been placed."},
-               {"status": "Packed", "time": "2025-11-02 12:30 PM", "details": "Your order has been packed."},
-               {"status": "Shipped", "time": "2025-11-03 08:00 AM", "details": "Your order has been shipped."}
-            ]
-            current_status = "Shipped"
-        else: # Pending or Cancelled
-            timeline = [
-               {"status": "Order Placed", "time": order.created_at.strftime('%Y-%m-%d %I:%M %p'), "details": "Your order has been placed."}
-            ]
-            current_status = "Order Placed"
-
-        mock_data = {
-            "orderId": f"#{order.id}",
-            "statusTimeline": timeline,
-            "currentStatus": current_status,
-            "estimatedDelivery": "2025-11-04" # Static for demo
-        }
-        return JsonResponse(mock_data)
-    except Order.DoesNotExist:
+    snapshot = tracking.order_tracking(order_id)
+    if snapshot is None or snapshot['user_id'] != request.user.id:
         return JsonResponse({"error": "Order not found"}, status=404)
 
+    last_modified = int(snapshot['last_modified'].timestamp())
+    response = get_conditional_response(request, etag=snapshot['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(snapshot['body'], content_type='application/json')
+    response['ETag'] = snapshot['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the copy but revalidate it on every poll
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+async def order_events(request):
+    """
+    Server-Sent Events stream of the user's order status and payment changes.
+
+    Needs the ASGI entry point (furnitureshop/asgi.py): there an open stream
+    is an idle coroutine, whereas a WSGI worker would be tied up for as long
+    as the page stays open. Under WSGI the stream answers 204, which tells
+    EventSource not to reconnect, and pages fall back to manual refresh.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    # Orders are published by customer; this is the stream's only query
+    customer_id = await Profile.objects.filter(user=user).values_list('id', flat=True).afirst()
+    if customer_id is None:
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(push.event_stream(customer_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@staff_member_required
+def db_metrics(request):
+    """Database connection and pool metrics of the worker process that answers"""
+    return JsonResponse(dbmetrics.snapshot())
+
+OFFER_ORDERINGS = {
+    'discount': ('-discount', 'sale_price'),
+    'price': ('sale_price', 'id'),  # walks product_sale_price_idx
+    '-price': ('-sale_price', '-id'),
+}
+
 def offers_page(request):
     categories = Category.objects.all()
-    products = Product.objects.order_by('-discount').all()[:24]
-    return render(request, 'shop/offers.html', { 'categories': categories, 'products': products })
+    sort = request.GET.get('sort')
+    if sort not in OFFER_ORDERINGS:
+        sort = 'discount'
+    products = Product.objects.filter(discount__gt=0).order_by(*OFFER_ORDERINGS[sort])[:24]
+    return render(request, 'shop/offers.html', { 'categories': categories, 'products': products, 'sort': sort })
 
 # --------------------------
 # About page
@@ -337,8 +407,21 @@ def order_success(request, order_id):
 @login_required(login_url='login')
 def my_orders(request):
     profile = getattr(request.user, 'profile', None)
-    orders = Order.objects.filter(customer=profile).order_by('-created_at') if profile else []
-    return render(request, 'shop/my_orders.html', { 'orders': orders })
+    orders, next_cursor = [], None
+    if profile:
+        # Two queries per page however many orders/items: orders, items.
+        # The lines carry their own product snapshot.
+        orders, next_cursor = keyset_page(
+            Order.objects.filter(customer=profile).annotate(
+                subtotal=Sum('items__line_total')
+            ).prefetch_related('items'),
+            cursor=request.GET.get('cursor'),
+            page_size=settings.ORDERS_PER_PAGE,
+        )
+    return render(request, 'shop/my_orders.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+    })
 
 # --------------------------
 # Cancel Order
@@ -365,59 +448,29 @@ def cancel_order(request, order_id):
 # --------------------------
 @login_required(login_url='login')
 def download_invoice(request, order_id):
-    from django.http import HttpResponse
-    profile = getattr(request.user, 'profile', None)
-    order = get_object_or_404(Order, id=order_id, customer=profile)
-    
-    # Create a simple text invoice (you can enhance this with PDF generation)
-    invoice_content = f"""
-    ========================================
-    IDEAL FURNITURE - INVOICE
-    ========================================
-    
-    Order ID: #{order.id}
-    Date: {order.created_at.strftime('%d %B, %Y')}
-    Status: {order.status}
-    
-    ----------------------------------------
-    CUSTOMER DETAILS
-    ----------------------------------------
-    Name: {request.user.get_full_name() or request.user.username}
-    Email: {request.user.email}
-    Phone: {profile.mobile_number if profile else 'N/A'}
-    
-    ----------------------------------------
-    SHIPPING ADDRESS
-    ----------------------------------------
-    {order.shipping_address or 'N/A'}
-    
-    ----------------------------------------
-    ORDER ITEMS
-    ----------------------------------------
     """
-    
-    for item in order.items.all():
-        invoice_content += f"\n{item.product.name}\n"
-        invoice_content += f"Quantity: {item.quantity}\n"
-        invoice_content += f"Price: ₹{item.product.discounted_price()}\n"
-        invoice_content += f"Subtotal: ₹{item.total_price()}\n"
-        invoice_content += "----------------------------------------\n"
-    
-    invoice_content += f"""
-    ----------------------------------------
-    PAYMENT SUMMARY
-    ----------------------------------------
-    Total Amount: ₹{order.total_amount}
-    Payment Method: {order.payment_method.upper()}
-    Payment Status: {order.payment_status}
-    
-    ========================================
-    Thank you for shopping with us!
-    ========================================
+    The order's invoice as a PDF (or ?format=txt), streamed.
+
+    Served straight from the invoice cache when this version of the order
+    has been rendered before; otherwise rendered chunk by chunk into the
+    response and the cache at the same time.
     """
-    
-    response = HttpResponse(invoice_content, content_type='text/plain')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{order.id}.txt"'
+    fmt = request.GET.get('format', 'pdf')
+    if fmt not in invoices.FORMATS:
+        raise Http404("Unknown invoice format")
+    profile = getattr(request.user, 'profile', None)
+    order = get_object_or_404(invoices.invoice_orders(), id=order_id, customer=profile)
+    data = invoices.invoice_data(order)
+
+    filename = f"invoice_{order.id}.{fmt}"
+    path = invoices.cached_file(data, fmt)
+    if path is not None:
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=filename,
+            content_type=invoices.FORMATS[fmt],
+        )
+    response = StreamingHttpResponse(invoices.cached_stream(data, fmt), content_type=invoices.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 # --------------------------
@@ -447,24 +500,15 @@ def buy_now(request, product_id):
             profile.mobile_number = phone
             profile.save()
 
-            # Recalculate total for order creation
-            subtotal = product.discounted_price() * quantity
-            cgst = round(subtotal * Decimal('0.09'), 2)
-            sgst = round(subtotal * Decimal('0.09'), 2)
-            delivery_charge = Decimal('50.00')
-            packaging_charge = Decimal('20.00')
-            handling_charge = Decimal('15.00')
-            grand_total = subtotal + cgst + sgst + delivery_charge + packaging_charge + handling_charge
-
-            order = Order.objects.create(
-                customer=profile,
-                user=request.user,
+            # Prices are snapshotted and the total computed by the checkout service
+            order = create_order(
+                request.user,
+                [(product.id, quantity)],
+                profile=profile,
                 shipping_address=address,
-                total_amount=grand_total,
                 payment_method=payment_method,
                 payment_status='Pending'
             )
-            OrderItem.objects.create(order=order, product=product, quantity=quantity)
 
             # If payment is online, redirect to Razorpay. Otherwise, show success.
             if payment_method in ['upi', 'card']:
@@ -484,30 +528,16 @@ def buy_now(request, product_id):
         quantity = 1
 
     # --- Perform Billing Calculations ---
-    subtotal = product.discounted_price() * quantity
-    cgst = round(subtotal * Decimal('0.09'), 2)
-    sgst = round(subtotal * Decimal('0.09'), 2)
-    delivery_charge = Decimal('50.00')
-    packaging_charge = Decimal('20.00')
-    handling_charge = Decimal('15.00')
-    grand_total = subtotal + cgst + sgst + delivery_charge + packaging_charge + handling_charge
-
-    # --- Prepare Context for Template ---
-    total_gst = cgst + sgst
-    base_price = product.discounted_price()
+    totals = price_basket([(product.price, product.discount, quantity)])
     context = {
         'product': product,
         'profile': profile,
         'quantity': quantity,
-        'subtotal': subtotal,
-        'cgst': cgst,
-        'sgst': sgst,
-        'total_gst': total_gst,
-        'delivery_charge': delivery_charge,
-        'packaging_charge': packaging_charge,
-        'handling_charge': handling_charge,
-        'grand_total': grand_total,
-        'base_price': base_price,
+        'base_price': product.discounted_price(),
+        # One product means one slab; the page recomputes totals for other quantities
+        'gst_percent': totals['gst_rate'] * 100,
+        'cgst_percent': totals['gst_rate'] * 50,
+        **totals,
     }
 
     return render(request, 'shop/buy_now.html', context)
@@ -515,14 +545,19 @@ def buy_now(request, product_id):
 # --------------------------
 # Payments (Razorpay)
 # --------------------------
+# These views are async: under ASGI a worker keeps serving other requests
+# while it waits on the gateway. Under WSGI Django runs them to completion
+# as before.
 @login_required(login_url='login')
-def payment_create(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+async def payment_create(request, order_id):
+    user = await request.auser()
+    order = await aget_object_or_404(Order, id=order_id)
     # Ensure order has items; if not, try to hydrate from user's cart
-    if order.items.count() == 0 and request.user.is_authenticated:
-        cart_obj, _ = Cart.objects.get_or_create(user=request.user)
-        for ci in cart_obj.items.select_related('product').all():
-            OrderItem.objects.get_or_create(order=order, product=ci.product, defaults={'quantity': ci.quantity})
+    if not await order.items.aexists():
+        try:
+            order = await sync_to_async(checkout_cart)(user, order=order)
+        except EmptyCheckout:
+            pass
 
     # Check if Razorpay keys are configured
     if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
@@ -535,14 +570,13 @@ def payment_create(request, order_id):
     amount_paise = amount_rupees * 100
     
     try:
-        client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-        rp_order = client.order.create(dict(
+        rp_order = await gateway.acreate_order(dict(
             amount=amount_paise, 
             currency='INR', 
             payment_capture=1
         ))
         
-        Payment.objects.create(
+        await Payment.objects.acreate(
             order=order, 
             razorpay_order_id=rp_order['id'], 
             amount=amount_rupees, 
@@ -558,8 +592,8 @@ def payment_create(request, order_id):
             'description': f'Order #{order.id}',
             'order_id': rp_order['id'],
             'prefill': {
-                'name': request.user.get_full_name() or request.user.username, 
-                'email': request.user.email or ''
+                'name': user.get_full_name() or user.username, 
+                'email': user.email or ''
             },
             'notes': {'order_id': str(order.id)},
             'theme': {'color': '#b57a50'}
@@ -571,6 +605,11 @@ def payment_create(request, order_id):
             'message': 'Invalid payment request. Please try again.',
             'detail': str(e)[:200]
         }, status=400)
+    except gateway.GatewayUnavailable:
+        return JsonResponse({
+            'ok': False, 
+            'message': 'Payment gateway is busy. Please try again in a minute.'
+        }, status=503)
     except Exception as e:
         return JsonResponse({
             'ok': False, 
@@ -579,7 +618,7 @@ def payment_create(request, order_id):
         }, status=500)
 
 @csrf_exempt
-def payment_verify(request):
+async def payment_verify(request):
     """Verify Razorpay payment signature"""
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'message': 'Invalid request method'}, status=400)
@@ -603,30 +642,17 @@ def payment_verify(request):
             'message': 'Payment gateway not configured'
         }, status=400)
     
-    try:
-        client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-        client.utility.verify_payment_signature({
-            'razorpay_order_id': rp_order_id,
-            'razorpay_payment_id': rp_payment_id,
-            'razorpay_signature': rp_signature
-        })
-    except razorpay.errors.SignatureVerificationError:
+    if not signatures.verify_payment_signature(rp_order_id, rp_payment_id, rp_signature):
         # Update payment status to failed
-        Payment.objects.filter(razorpay_order_id=rp_order_id).update(
+        await Payment.objects.filter(razorpay_order_id=rp_order_id).aupdate(
             razorpay_payment_id=rp_payment_id, 
             razorpay_signature=rp_signature, 
             status='failed'
         )
         return JsonResponse({'ok': False, 'message': 'Payment verification failed'}, status=400)
-    except Exception as e:
-        return JsonResponse({
-            'ok': False, 
-            'message': 'Verification error',
-            'detail': str(e)[:200]
-        }, status=500)
     
     # Find and update payment
-    payment = Payment.objects.filter(razorpay_order_id=rp_order_id).select_related('order').first()
+    payment = await Payment.objects.filter(razorpay_order_id=rp_order_id).select_related('order').afirst()
     if not payment:
         return JsonResponse({'ok': False, 'message': 'Payment record not found'}, status=404)
     
@@ -634,17 +660,18 @@ def payment_verify(request):
     payment.razorpay_payment_id = rp_payment_id
     payment.razorpay_signature = rp_signature
     payment.status = 'paid'
-    payment.save()
+    await payment.asave()
     
     payment.order.payment_status = 'Paid'
-    payment.order.save()
+    await payment.order.asave()
     
     return JsonResponse({'ok': True, 'message': 'Payment verified successfully'})
 
 @csrf_exempt
-def razorpay_webhook(request):
+async def razorpay_webhook(request):
     """
-    Handle incoming webhooks from Razorpay to automatically update order status.
+    Receive Razorpay webhooks. Verified events are only written to the
+    WebhookEvent inbox here; shop.webhooks applies them to payments/orders.
     """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
@@ -658,44 +685,24 @@ def razorpay_webhook(request):
         return JsonResponse({'status': 'error', 'message': 'Missing required data for verification'}, status=400)
 
     # Verify the webhook signature
-    try:
-        client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-        client.utility.verify_webhook_signature(body.decode('utf-8'), signature, settings.RAZORPAY_WEBHOOK_SECRET)
-    except razorpay.errors.SignatureVerificationError:
+    if not signatures.verify_webhook_signature(body, signature):
         return JsonResponse({'status': 'error', 'message': 'Webhook signature verification failed'}, status=400)
-    except Exception as e:
-        return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {str(e)}'}, status=500)
 
-    # Process the event payload
+    # Store the event for `manage.py process_webhooks` and acknowledge at once
     try:
-        payload = json.loads(body)
-        event = payload.get('event')
-
-        if event == 'payment.captured':
-            payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
-            razorpay_order_id = payment_entity.get('order_id')
-            razorpay_payment_id = payment_entity.get('id')
-
-            if not razorpay_order_id:
-                return JsonResponse({'status': 'ignored', 'message': 'No Razorpay Order ID in payload'}, status=200)
-
-            # Find the payment and order in your database
-            payment = Payment.objects.filter(razorpay_order_id=razorpay_order_id).select_related('order').first()
-            if payment and payment.status != 'paid':
-                # Update payment and order status
-                payment.razorpay_payment_id = razorpay_payment_id
-                payment.status = 'paid'
-                payment.save()
-
-                payment.order.payment_status = 'Paid'
-                payment.order.save()
-                
-                return JsonResponse({'status': 'success', 'message': f'Order {payment.order.id} updated to Paid.'}, status=200)
-
-    except (json.JSONDecodeError, KeyError, AttributeError):
+        # Razorpay sends UTF-8; json.loads alone would also take UTF-16/32
+        text = body.decode('utf-8')
+        payload = json.loads(text)
+        event = str(payload.get('event') or '')
+    except (ValueError, AttributeError):
         return JsonResponse({'status': 'error', 'message': 'Invalid payload format'}, status=400)
+    try:
+        event_id = webhooks.event_id_for(request.headers, body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid event id'}, status=400)
 
-    return JsonResponse({'status': 'ok', 'message': 'Webhook received and processed'}, status=200)
+    await webhooks.aenqueue(event_id, event[:100], text)
+    return JsonResponse({'status': 'ok', 'message': 'Webhook received'}, status=200)
 
 @login_required(login_url='login')
 def pay_now(request, order_id):
@@ -705,57 +712,62 @@ def pay_now(request, order_id):
     if order.payment_status == 'Paid':
         return redirect('order_success', order_id=order.id)
 
-    # If order has no items, populate from cart
-    if order.items.count() == 0:
-        cart_obj, _ = Cart.objects.get_or_create(user=request.user)
-        for ci in cart_obj.items.select_related('product').all():
-            OrderItem.objects.get_or_create(
-                order=order,
-                product=ci.product,
-                defaults={'quantity': ci.quantity}
-            )
-
-    # Calculate billing
-    subtotal = sum(item.product.price * item.quantity for item in order.items.all())
-    tax = round(subtotal * 0.18, 2)  # GST 18%
-    delivery = 50 if subtotal > 0 else 0  # Optional: free delivery if subtotal > certain amount
-    total = round(subtotal + tax + delivery, 2)
+    # If order has no items, populate from cart (this also sets the order total)
+    if not order.items.exists():
+        try:
+            order = checkout_cart(request.user, order=order)
+        except EmptyCheckout:
+            pass
 
-    # Update order total
-    order.total_amount = total
-    order.save()
+    # Calculate billing from the price snapshot on the order lines
+    order_items = order.items.all()
+    totals = price_basket((item.unit_price, item.discount, item.quantity) for item in order_items)
 
     context = {
         'order': order,
-        'order_items': order.items.all(),
-        'subtotal': subtotal,
-        'tax': tax,
-        'delivery': delivery,
-        'total': total
+        'order_items': order_items,
+        'subtotal': totals['subtotal'],
+        'tax': totals['total_gst'],
+        'delivery': totals['delivery_charge'],
+        'total': order.total_amount
     }
 
-    return render(request, 'pay_now.html', context)
+    return render(request, 'shop/pay_now.html', context)
 
 # --------------------------
-# Add to Cart
+# Cart mutations (add / increment / decrement / remove)
 # --------------------------
+async def _cart_response(request, product_id, state, message):
+    """JSON for AJAX callers, otherwise flash a message and go to the cart"""
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({
+            'ok': True,
+            'product_id': product_id,
+            'quantity': state.quantity or 0,
+            'cart_count': state.cart_count,
+        })
+    # Messages live in the session, which loads synchronously
+    await sync_to_async(messages.success)(request, message)
+    return redirect('cart')
+
 @login_required(login_url='login')
-def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    # Ensure user cart exists in DB
-    cart_obj, _ = Cart.objects.get_or_create(user=request.user)
-    item, created = CartItem.objects.get_or_create(cart=cart_obj, product=product)
-    if not created:
-        item.quantity += 1
-        item.save()
+async def add_to_cart(request, product_id):
+    try:
+        state = await aadd_item(await request.auser(), product_id)
+    except Product.DoesNotExist:
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'ok': False, 'message': 'Product not found'}, status=404)
+        raise Http404("Product not found")
+    return await _cart_response(request, product_id, state, "Item added to cart!")
 
-    # Mirror to session for quick count display
-    session_cart = request.session.get('cart', {})
-    session_cart[str(product.id)] = item.quantity
-    request.session['cart'] = session_cart
+@login_required(login_url='login')
+async def increment_cart_item(request, product_id):
+    return await add_to_cart(request, product_id)
 
-    messages.success(request, f"{product.name} added to cart!")
-    return redirect('cart')
+@login_required(login_url='login')
+async def decrement_cart_item(request, product_id):
+    state = await adecrement_item(await request.auser(), product_id)
+    return await _cart_response(request, product_id, state, "Cart updated.")
 
 # --------------------------
 # View Cart
@@ -765,34 +777,26 @@ def cart_view(request):
     cart_obj, _ = Cart.objects.get_or_create(user=request.user)
     items = cart_obj.items.select_related('product').all()
     products = []
-    total = 0
     for item in items:
         product = item.product
         product.qty = item.quantity
-        product.total_price = product.price * item.quantity
+        product.total_price = item.line_total()
         products.append(product)
-        total += product.total_price
-
-    # sync session count for header
-    request.session['cart'] = {str(i.product.id): i.quantity for i in items}
 
-    return render(request, 'shop/cart.html', {'products': products, 'total': total})
+    return render(request, 'shop/cart.html', {'products': products, 'total': cart_obj.subtotal})
 
 # --------------------------
 # Remove from Cart
 # --------------------------
 @login_required(login_url='login')
-def remove_from_cart(request, product_id):
-    cart_obj, _ = Cart.objects.get_or_create(user=request.user)
-    try:
-        item = cart_obj.items.select_related('product').get(product_id=product_id)
-        item.delete()
-        # sync session count for header
-        request.session['cart'] = {str(i.product.id): i.quantity for i in cart_obj.items.all()}
-        messages.success(request, "Item removed from cart.")
-    except CartItem.DoesNotExist:
-        messages.error(request, "Item not found in your cart.")
-    return redirect('cart')
+async def remove_from_cart(request, product_id):
+    state = await aremove_item(await request.auser(), product_id)
+    if state.quantity is None:
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'ok': False, 'message': 'Item not found in your cart'}, status=404)
+        await sync_to_async(messages.error)(request, "Item not found in your cart.")
+        return redirect('cart')
+    return await _cart_response(request, product_id, state, "Item removed from cart.")
 
 # --------------------------
 # Wishlist View
@@ -0,0 +1,118 @@
+import hashlib
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, Payment, WebhookEvent
+
+# Give up on an event (and leave it for inspection in the admin) after this
+# many failed applications
+MAX_ATTEMPTS = 5
+
+
+# --------------------------
+# Inbox (request side)
+# --------------------------
+# Longest event id the inbox column stores
+EVENT_ID_MAX_LENGTH = WebhookEvent._meta.get_field('event_id').max_length
+
+
+def event_id_for(headers, body):
+    """
+    Razorpay's X-Razorpay-Event-Id, or a digest of the body if it is missing.
+
+    Raises ValueError for a header too long to store.
+    """
+    event_id = headers.get('X-Razorpay-Event-Id')
+    if not event_id:
+        return 'sha256:' + hashlib.sha256(body).hexdigest()[:EVENT_ID_MAX_LENGTH - 7]
+    if len(event_id) > EVENT_ID_MAX_LENGTH:
+        raise ValueError(f"Event id longer than {EVENT_ID_MAX_LENGTH} characters")
+    return event_id
+
+
+async def aenqueue(event_id, event, payload):
+    """
+    Store a verified webhook (`payload` is the decoded body) in the inbox
+    with a single INSERT.
+
+    Replays of an event id that is already stored are ignored by the unique
+    constraint, so redelivery never applies an event twice.
+    """
+    await WebhookEvent.objects.abulk_create(
+        [WebhookEvent(event_id=event_id, event=event, payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+# --------------------------
+# Event handlers (worker side)
+# --------------------------
+def payment_captured(payload):
+    entity = payload['payload']['payment']['entity']
+    rp_order_id = entity.get('order_id')
+    if not rp_order_id:
+        return
+    # Only unpaid payments change, so re-applying the event is a no-op
+    updated = Payment.objects.filter(razorpay_order_id=rp_order_id).exclude(status='paid').update(
+        razorpay_payment_id=entity.get('id'), status='paid'
+    )
+    if updated:
+        # save(), not update(): the Order post_save receivers record status
+        # events and push the change to the customer's open pages
+        for order in Order.objects.filter(payments__razorpay_order_id=rp_order_id):
+            order.payment_status = 'Paid'
+            order.save(update_fields=['payment_status'])
+
+
+HANDLERS = {
+    'payment.captured': payment_captured,
+}
+
+
+def apply_event(webhook):
+    handler = HANDLERS.get(webhook.event)
+    if handler is not None:
+        handler(json.loads(webhook.payload))
+
+
+def process_batch(batch_size=100):
+    """
+    Apply up to `batch_size` pending events, oldest first, in one transaction.
+
+    Each event runs in its own savepoint; one that raises is rolled back,
+    has its error recorded and is retried by a later batch until it has
+    failed MAX_ATTEMPTS times. Returns the number of events taken from the
+    inbox, failed ones included.
+    """
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.filter(processed_at__isnull=True).order_by('id')[:batch_size]
+        )
+        done = []
+        for webhook in events:
+            try:
+                with transaction.atomic():
+                    apply_event(webhook)
+            except Exception as exc:
+                webhook.attempts += 1
+                webhook.error = f"{type(exc).__name__}: {exc}"[:1000]
+                if webhook.attempts >= MAX_ATTEMPTS:
+                    webhook.processed_at = timezone.now()
+                webhook.save(update_fields=['attempts', 'error', 'processed_at'])
+            else:
+                done.append(webhook.pk)
+        if done:
+            WebhookEvent.objects.filter(pk__in=done).update(processed_at=timezone.now(), error='')
+    return len(events)
+
+
+def drain(batch_size=100):
+    """Process batches until the inbox has fewer than `batch_size` pending; returns the events taken"""
+    total = 0
+    while True:
+        count = process_batch(batch_size)
+        total += count
+        if count < batch_size:
+            return total